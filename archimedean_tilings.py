@@ -3,7 +3,18 @@ This is a Python implementation of the ideas described in Chapter 19 (Archimedea
 "Symmetries of Things" by John H. Conway, Heidi Burgiel, and Chaim Goodman-Strauss.
 """
 
+import mmap
+import multiprocessing.pool
+import os
+import random
 import re
+import sys
+import threading
+import warnings
+
+# Guards the state which is filled in lazily and may be shared between threads: the caches of face_of and
+# boundary_component_of, the faces built from a symbol table record, and the loading of the symbol table.
+_lock = threading.Lock()
 
 
 class DoilyFeature(object):
@@ -144,24 +155,58 @@ class EdgeLine:
         assert False, "We shouldn't get here in touching_boundary_edgeline"
 
 
-class Face:
+class _Frozen(object):
+    """
+        Base class for the results of a PermutationSymbol, which may be shared between threads and caches.  Once
+        freeze() has been called, the attributes cannot be set or deleted.
+    """
+    frozen = False
+
+    def __setattr__(self, name, value):
+        if self.frozen:
+            raise AttributeError('%s objects cannot be changed after they are computed' % type(self).__name__)
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if self.frozen:
+            raise AttributeError('%s objects cannot be changed after they are computed' % type(self).__name__)
+        object.__delattr__(self, name)
+
+    def freeze(self):
+        object.__setattr__(self, 'frozen', True)
+        return self
+
+
+class Face(_Frozen):
     def __init__(self, index, location, edgelines):
+        """
+            The edgelines are a list while the face is being walked (see add_edgeline); freeze() makes them a tuple.
+        """
         self.index = index
         self.location = location
         self.edgelines = edgelines
 
     def __eq__(self, other):
-        return other is not None and self.__dict__ == other.__dict__
+        return other is not None and (self.index, self.location, tuple(self.edgelines)) == \
+            (other.index, other.location, tuple(other.edgelines))
 
     def __repr__(self):
-        return str(self.index) + ': ' + str(self.edgelines)
+        return str(self.index) + ': [' + ', '.join(map(repr, self.edgelines)) + ']'
 
     def add_edgeline(self, edgeline, all_edgelines):
         if not isinstance(edgeline, EdgeLine):
             raise ValueError("edgeline parameter to Face.add_edgeline must be of class EdgeLine")
+        if self.frozen:
+            raise ValueError('Cannot add an edgeline to a face which has been computed')
         self.edgelines.append(edgeline)
         del all_edgelines[all_edgelines.index(edgeline)]
 
+    def freeze(self):
+        if self.frozen:
+            return self
+        self.edgelines = tuple(self.edgelines)
+        return _Frozen.freeze(self)
+
     def number_of_sides(self):
         half_sides = 0
         for el in self.edgelines:
@@ -175,21 +220,29 @@ class Face:
         return sides
 
 
-class BoundaryComponent:
+class BoundaryComponent(_Frozen):
     def __init__(self):
         self.faces = []
 
     def __eq__(self, other):
-        return other is not None and self.__dict__ == other.__dict__
+        return other is not None and tuple(self.faces) == tuple(other.faces)
 
     def __repr__(self):
-        return str(self.faces)
+        return '[' + ', '.join(map(repr, self.faces)) + ']'
 
     def add_face(self, face):
+        if self.frozen:
+            raise ValueError('Cannot add a face to a boundary component which has been computed')
         self.faces.append(face)
 
+    def freeze(self):
+        if self.frozen:
+            return self
+        self.faces = tuple(face.freeze() for face in self.faces)
+        return _Frozen.freeze(self)
+
 
-class Orbifold:
+class Orbifold(_Frozen):
     def __init__(self, gyrations, kaleidoscopes, handles, crosscaps):
         """
             Orbifolds are stored with the following normalizations.
@@ -197,19 +250,22 @@ class Orbifold:
             Gyrations: sorted and all 1's removed.
             Kaleidoscopes: all 1's removed.
             Handles and crosscaps: Crosscaps = 0,1,or 2; and number of handles increased accordingly.
+
+            The gyrations are a tuple and the kaleidoscopes a tuple of tuples, and an Orbifold cannot be changed.
         """
-        self.gyrations = sorted([x for x in gyrations if x != 1],
-                                key=lambda y: (0, y) if isinstance(y, int) else (1, y))  # rotation 2's come first
-        self.kaleidoscopes = [[x for x in k if x != 1] for k in kaleidoscopes]
+        self.gyrations = tuple(sorted([x for x in gyrations if x != 1],
+                                      key=lambda y: (0, y) if isinstance(y, int) else (1, y)))  # rotation 2's first
+        self.kaleidoscopes = tuple(tuple(x for x in k if x != 1) for k in kaleidoscopes)
+        if crosscaps > 2:
+            if crosscaps % 2 == 1:
+                handles += (crosscaps - 1) // 2
+                crosscaps = 1
+            else:
+                handles += (crosscaps - 2) // 2
+                crosscaps = 2
         self.handles = handles
         self.crosscaps = crosscaps
-        if self.crosscaps > 2:
-            if self.crosscaps % 2 == 1:
-                self.handles += (self.crosscaps - 1) // 2
-                self.crosscaps = 1
-            else:
-                self.handles += (self.crosscaps - 2) // 2
-                self.crosscaps = 2
+        self.freeze()
 
     def __repr__(self):
         # display the signature in the order described in SoT, p. 27.
@@ -222,11 +278,98 @@ class Orbifold:
         signature += 'x' * self.crosscaps
         return signature
 
+    _ITEM_RE = '(?:[0-9]+|\\[[0-9]+\\]|[a-z]+)'
+    _LIST_RE = '(?:%s(?:,%s)*)?' % (_ITEM_RE, _ITEM_RE)
+    _SIGNATURE_RE = re.compile('(o*)(?:\\((%s)\\))?((?:\\*\\(%s\\))*)(x*)' % (_LIST_RE, _LIST_RE))
+
+    @staticmethod
+    def _parse_items(items):
+        return [int(x) if x.isdigit() else x for x in items.split(',')] if items else []
+
+    @staticmethod
+    def from_string(signature):
+        """
+            Parse a signature as written by __repr__, such as o(2,[1],n)*([0],12)*()xx: numbers, face parameters
+            [k] and other parameters such as n, in any number of digits.  Orbifold.from_string(repr(o)) == o, and
+            its repr is repr(o).
+        """
+        match = Orbifold._SIGNATURE_RE.fullmatch(signature)
+        if match is None:
+            raise ValueError('Invalid orbifold signature %s' % signature)
+        handles, gyrations, kaleidoscopes, crosscaps = match.groups()
+        # the kaleidoscopes look like *(a,b)*(c); no item contains a parenthesis, so they split on ')*('
+        return Orbifold(Orbifold._parse_items(gyrations),
+                        [Orbifold._parse_items(k) for k in kaleidoscopes[2:-1].split(')*(')] if kaleidoscopes else [],
+                        len(handles), len(crosscaps))
+
+    @staticmethod
+    def parse_many(signatures):
+        """
+            The list of Orbifold.from_string of each signature, ignoring surrounding whitespace, such as the lines of
+            a file.  Orbifolds cannot be changed, so repeated signatures share one Orbifold and are parsed once.
+        """
+        parsed = {}
+        result = []
+        for signature in signatures:
+            signature = signature.strip()
+            orbifold = parsed.get(signature)
+            if orbifold is None:
+                orbifold = parsed[signature] = Orbifold.from_string(signature)
+            result.append(orbifold)
+        return result
+
+    @staticmethod
+    def format_many(orbifolds):
+        """
+            The list of the signatures of the given orbifolds, formatting each distinct Orbifold object once.
+        """
+        formatted = {}
+        result = []
+        for orbifold in orbifolds:
+            signature = formatted.get(id(orbifold))
+            if signature is None:
+                signature = formatted[id(orbifold)] = repr(orbifold)
+            result.append(signature)
+        return result
+
+    @staticmethod
+    def _kaleidoscope_key(kaleidoscope):
+        return [(0, x) if isinstance(x, int) else (1, x) for x in kaleidoscope]
+
+    @staticmethod
+    def _smallest_rotation(kaleidoscope):
+        return min((kaleidoscope[i:] + kaleidoscope[:i] for i in range(len(kaleidoscope))),
+                   key=Orbifold._kaleidoscope_key, default=kaleidoscope)
+
+    def canonical(self):
+        """
+            An Orbifold equal to this one, with each kaleidoscope started at its smallest rotation and the
+            kaleidoscopes sorted, so that equal orbifolds have the same repr.  A non-orientable orbifold may reflect
+            each kaleidoscope on its own, and an orientable one only all of them together, as in __eq__.
+        """
+        key = Orbifold._kaleidoscope_key
+        if self.crosscaps > 0:
+            kaleidoscopes = sorted((min(Orbifold._smallest_rotation(k), Orbifold._smallest_rotation(k[::-1]), key=key)
+                                    for k in self.kaleidoscopes), key=key)
+        else:
+            kaleidoscopes = min((sorted((Orbifold._smallest_rotation(k[::step]) for k in self.kaleidoscopes), key=key)
+                                 for step in (1, -1)), key=lambda ks: [key(k) for k in ks])
+        return Orbifold(self.gyrations, kaleidoscopes, self.handles, self.crosscaps)
+
+    def type_string(self):
+        """
+            The type of the orbifold: the repr of its canonical form with every face parameter [k] written as 'a',
+            such as '(2,a,n)*(a)'.  Orbifolds which are equal, or differ only in their faces, have the same type.
+        """
+        def generic(x):
+            return 'a' if isinstance(x, str) and x.startswith('[') else x
+        orbifold = Orbifold([generic(g) for g in self.gyrations], [[generic(x) for x in k] for k in self.kaleidoscopes],
+                            self.handles, self.crosscaps)
+        return repr(orbifold.canonical())
+
     @staticmethod
     def cyclic_shift(x):
-        if len(x) == 0:
-            return x
-        return x[1:] + [x[0]]
+        return x[1:] + x[:1]
 
     @staticmethod
     def normalized_kaleidoscopes_equal(k1, k2):
@@ -241,6 +384,7 @@ class Orbifold:
             2 if the kaleidoscopes are equivalent with both orientations
         """
 
+        k1, k2 = list(k1), list(k2)
         if len(k1) != len(k2):
             return 0
         if k1 == []:
@@ -309,9 +453,22 @@ class Orbifold:
             self_index += 1
         return True
 
+    def __hash__(self):
+        # kaleidoscopes are only equal up to rotation and reflection, so hash their sorted contents
+        return hash((self.handles, self.crosscaps, self.gyrations,
+                     tuple(sorted(tuple(sorted(map(str, k))) for k in self.kaleidoscopes))))
+
 
 class PermutationSymbol:
-    def __init__(self, symbol_string):
+    # the results of set_face_info, which cannot be set again or deleted once they are computed, like the attributes
+    # of a frozen Face, BoundaryComponent or Orbifold
+    _COMPUTED_ATTRIBUTES = frozenset(('boundary_components', 'interior_faces', 'num_faces', 'face_code', 'orbifold'))
+
+    def __init__(self, symbol_string, face_info=True):
+        """
+            With face_info=False, the faces are not computed, and only the methods which walk part of the symbol,
+            such as face_of and boundary_component_of, can be used until set_face_info() is called.
+        """
         self.symbol_string = symbol_string
         numeric_re = "(?: *[0-9]+ *(?:, *[0-9]+ *)?)"
         feature_re = "((?:\\(" + numeric_re + "\\))|(?:\\[" + numeric_re + "\\])|(?:<" + numeric_re + ">))"
@@ -401,14 +558,16 @@ class PermutationSymbol:
         elif symbol_string[-1] == '*':
             self.local_symmetry = Location.BOUNDARY
 
-        self.edges = []
         for i in range(max_number + 1):
             if i not in edge_dict:
                 raise ValueError('Edge number %d missing from permutation symbol %s' % (i, symbol_string))
-            self.edges.append(edge_dict[i])
+        self.edges = tuple(edge_dict[i] for i in range(max_number + 1))
         self.num_edges = len(self.edges)
 
-        self.set_face_info()
+        self.face_cache = {}  # edgeline -> Face, for face_of
+        self.boundary_component_cache = {}  # id of a face -> BoundaryComponent, for boundary_component_of
+        if face_info:
+            self.set_face_info()
 
     def has_lower_boundary_edgeline(self):
         if self.num_half_arms == 0 and not self.has_half_band and self.local_symmetry == Location.BOUNDARY:
@@ -584,9 +743,25 @@ class PermutationSymbol:
             face_code = face_code[1:]
             face_code.append(first)
 
-        return face_code
+        return tuple(face_code)
 
     def get_orbifold(self):
+        summarize = self.boundary_face_summary
+        return self.get_orbifold_from_summary([map(summarize, bc.faces) for bc in self.boundary_components],
+                                              [f.index for f in self.interior_faces], self.num_faces)
+
+    def boundary_face_summary(self, f):
+        # the parts of a boundary face that get_orbifold_from_summary needs
+        edge_indices = [el.edge.index for el in f.edgelines if el.edge is not None]
+        return (f.index, 0 in edge_indices, self.num_edges - 1 in edge_indices,
+                any(el.edge is None and el.side == EdgeLineSide.UPPER for el in f.edgelines))
+
+    def get_orbifold_from_summary(self, boundary_components, interior_face_indices, num_faces):
+        """
+            The orbifold, given the index of each interior face, the number of faces, and for each boundary
+            component an iterable with a tuple for each of its faces:
+                (index, whether it touches edge 0, whether it touches edge m - 1, whether it has the edgeline BU)
+        """
         gyrations = []
         kaleidoscopes = []
         vertex_parameter_added = False
@@ -596,8 +771,8 @@ class PermutationSymbol:
         #   each interior faces gets a parameter
         #   if local symmetry is '.', then local vertex parameter 'n' is a gyration
         gyrations.extend([2]*self.num_rotary_arms)
-        for f in self.interior_faces:
-            gyrations.append('[' + str(f.index) + ']')
+        for index in interior_face_indices:
+            gyrations.append('[' + str(index) + ']')
         if self.local_symmetry == Location.INTERIOR:
             gyrations.append('n')
             vertex_parameter_added = True
@@ -610,22 +785,22 @@ class PermutationSymbol:
         #    if local symmetry is '*', then component containing m-1 (if not half-band) gets local vertex parameter 'n'
         #       appended
 
-        for bc in self.boundary_components:
+        for bc in boundary_components:
             kaleidoscope = []
             has_lower_half_arm = False
             has_upper_half_arm = False
             has_upper_boundary = False
-            if len(bc.faces) == 0:  # half-band
-                has_upper_boundary = True
-            for f in bc.faces:
-                kaleidoscope.append('[' + str(f.index) + ']')
-                edge_indices = [el.edge.index for el in f.edgelines if el.edge is not None]
-                if 0 in edge_indices and self.num_half_arms > 0:
+            for index, touches_first_edge, touches_last_edge, has_upper_boundary_edgeline in bc:
+                kaleidoscope.append('[' + str(index) + ']')
+                if touches_first_edge and self.num_half_arms > 0:
                     has_lower_half_arm = True
-                if self.num_edges - 1 in edge_indices and not self.has_half_band:
+                if self.num_half_arms == 2 and touches_last_edge:
                     has_upper_boundary = True
-                    if self.num_half_arms == 2:
-                        has_upper_half_arm = True
+                    has_upper_half_arm = True
+                elif has_upper_boundary_edgeline:
+                    has_upper_boundary = True
+            if not kaleidoscope:  # half-band
+                has_upper_boundary = True
             if has_lower_half_arm:
                 kaleidoscope.insert(0, 2)
             if has_upper_half_arm and self.num_edges > 1:
@@ -657,8 +832,8 @@ class PermutationSymbol:
                 orbifold_half_edges += 1  # these bands will be added twice and so contribute 2
         if self.local_symmetry == Location.BOUNDARY:
             orbifold_half_edges += 1  # the boundary component containing the half-vertex is another half-edge
-        orbifold_faces = self.num_faces
-        orbifold_boundaries = len(self.boundary_components)
+        orbifold_faces = num_faces
+        orbifold_boundaries = len(boundary_components)
 
         double_euler_characteristic = orbifold_half_vertices - orbifold_half_edges + 2 * orbifold_faces
         assert double_euler_characteristic % 2 == 0
@@ -680,17 +855,1050 @@ class PermutationSymbol:
 
         return Orbifold(gyrations, kaleidoscopes, handles, crosscaps)
 
-    def set_face_info(self):
+    def orbifold_only(self):
+        """
+            The orbifold, equal to self.orbifold, computed from face_labels without Face objects or the face code,
+            so that it is cheap and works on a symbol created with face_info=False.
+        """
+        m = self.num_edges
+        face, boundary_components, num_faces = self.face_labels()
+        return self.get_orbifold_from_summary(
+            [[(index, index in (face[0], face[1]), index in (face[2 * m - 2], face[2 * m - 1]),
+               index == face[2 * m + 1]) for index in component] for component in boundary_components],
+            range(sum(map(len, boundary_components)), num_faces), num_faces)
+
+    def face_labels(self):
+        """
+            The decomposition into faces as integers: return (labels, boundary_components, num_faces), where
+            labels[2 * edge + side] is the index of the face containing that edgeline, labels[2m] and labels[2m + 1]
+            those of BL and BU, and -1 marks the edgelines which do not exist; boundary_components is the list of
+            face indices of each boundary component.  The faces are walked in the same order as set_face_info, so
+            they get the same indices, and the interior faces are those numbered after the boundary faces.
+        """
+        m = self.num_edges
+        bl, bu = 2 * m, 2 * m + 1
+        has_lower, has_upper = self.has_lower_boundary_edgeline(), self.has_upper_boundary_edgeline()
+
+        # connected_edgeline, adjacent_edgeline and touching_boundary_edgeline, with -1 for None
+        connected = [-1] * (2 * m + 2)
+        adjacent = [-1] * (2 * m + 2)
+        touching_boundary = [-1] * (2 * m + 2)
+        for edge in self.edges:
+            i = edge.index
+            for side in (EdgeLineSide.LOWER, EdgeLineSide.UPPER):
+                e = 2 * i + side
+                if edge.feature == DoilyFeature.ROTARY_ARM:
+                    connected[e] = 2 * i + 1 - side
+                elif edge.feature == DoilyFeature.UNTWISTED_BAND:
+                    connected[e] = 2 * edge.endpoint + 1 - side
+                elif edge.feature == DoilyFeature.TWISTED_BAND:
+                    connected[e] = 2 * edge.endpoint + side
+                elif edge.feature == DoilyFeature.HALF_BAND:
+                    connected[e] = 2 * (m - 1) if i == 0 else 1
+                elif edge.feature == DoilyFeature.FOLDED_BAND:
+                    touching_boundary[e] = 2 * i + 1 - side
+                if i == 0 and side == EdgeLineSide.LOWER and has_lower:
+                    adjacent[e] = bl
+                elif i == m - 1 and side == EdgeLineSide.UPPER and has_upper:
+                    adjacent[e] = bu
+                elif side == EdgeLineSide.UPPER:
+                    adjacent[e] = 2 * ((i + 1) % m)
+                else:
+                    adjacent[e] = 2 * (i - 1 if i > 0 else m - 1) + 1
+        adjacent[bl], adjacent[bu] = 0, 2 * m - 1
+        if self.num_half_arms == 0:
+            touching_boundary[bl], touching_boundary[bu] = bu, bl
+        elif self.num_half_arms == 1:
+            touching_boundary[bu], touching_boundary[1] = 1, bu
+        else:
+            touching_boundary[1], touching_boundary[2 * m - 2] = 2 * m - 2, 1
+
+        # the edgelines of get_all_edgelines, in order; face is None for those not yet in a face, and -1 for the
+        # edgelines which do not exist
+        order = [e for e in range(2 * m) if self.has_edgeline(e >> 1, e & 1)]
+        if has_lower:
+            order.insert(0, bl)
+        if has_upper:
+            order.append(bu)
+        face = [-1] * (2 * m + 2)
+        for e in order:
+            face[e] = None
+
+        def fundamental_iteration(e, index):
+            # as PermutationSymbol.fundamental_iteration; return the last edgeline added to the face
+            while True:
+                c = connected[e]
+                if c < 0 or face[c] is not None:
+                    return e
+                face[c] = index
+                a = adjacent[c]
+                if face[a] is not None:
+                    return c
+                face[a] = index
+                e = a
+
+        def starts_boundary_component(e):
+            # as get_next_boundary_edgeline: BL, or an upper edgeline which touches the boundary
+            return face[e] is None and (e == bl or (e < bl and e & 1 == 1 and touching_boundary[e] >= 0))
+
+        boundary_components = []
+        num_faces = 0
+        position = 0
+        while True:
+            while position < len(order) and not starts_boundary_component(order[position]):
+                position += 1
+            if position == len(order):
+                break
+            e = order[position]
+            component = []
+            while face[e] is None:
+                face[e] = num_faces
+                face[adjacent[e]] = num_faces
+                e = touching_boundary[fundamental_iteration(adjacent[e], num_faces)]
+                component.append(num_faces)
+                num_faces += 1
+            boundary_components.append(component)
+        if self.has_half_band:  # the edge of the half-band is a boundary component that touches no face.
+            boundary_components.append([])
+
+        for e in order:
+            if face[e] is None and e & 1 == 1:  # each interior face starts with its first upper edgeline
+                face[e] = num_faces
+                fundamental_iteration(e, num_faces)
+                num_faces += 1
+
+        return face, boundary_components, num_faces
+
+    def has_edgeline(self, edge_index, side):
+        # the same edgelines as get_all_edgelines
+        if edge_index is None:
+            return self.has_lower_boundary_edgeline() if side == EdgeLineSide.LOWER else \
+                self.has_upper_boundary_edgeline()
+        if not 0 <= edge_index < self.num_edges:
+            return False
+        if side == EdgeLineSide.LOWER and edge_index == 0:
+            return not (self.has_half_band or self.edges[0].feature == DoilyFeature.HALF_ARM)
+        if side == EdgeLineSide.UPPER and edge_index == self.num_edges - 1 and edge_index > 0:
+            return not (self.has_half_band or self.edges[edge_index].feature == DoilyFeature.HALF_ARM)
+        return True
+
+    def edgeline_order(self, edgeline):
+        # the position of an edgeline in get_all_edgelines, up to gaps
+        if edgeline.edge is None:
+            return -1 if edgeline.side == EdgeLineSide.LOWER else 2 * self.num_edges
+        return 2 * edgeline.edge.index + edgeline.side
+
+    def face_of(self, edge_index, side):
+        """
+            The face containing the given edgeline (edge_index is None for a boundary edgeline).
+
+            If the faces have been computed, this is one of them.  Otherwise only the face containing the edgeline
+            is found, by following connected_edgeline and adjacent_edgeline from it, and its index is None.  Its
+            edgelines are listed in the order set_face_info would list them when it starts the face there: an
+            interior face starts with its first upper edgeline, and a boundary face starts with one of its two ends.
+            Either way the face is remembered for all of its edgelines, so later queries about them are free.
+        """
+        if not self.has_edgeline(edge_index, side):
+            raise ValueError('Edgeline %s%s does not exist in permutation symbol %s' % (
+                'B' if edge_index is None else edge_index, 'U' if side == EdgeLineSide.UPPER else 'L',
+                self.symbol_string))
+        edgeline = EdgeLine(edge_index, side, self)
+        if edgeline in self.face_cache:
+            return self.face_cache[edgeline]
+        if hasattr(self, 'interior_faces'):
+            for face in [f for bc in self.boundary_components for f in bc.faces] + list(self.interior_faces):
+                for el in face.edgelines:
+                    self.face_cache[el] = face
+            return self.face_cache[edgeline]
+
+        # Every edgeline has an adjacent edgeline, and most have a connected edgeline, so the face is a cycle
+        # alternating between the two, or a path between two edgelines with no connected edgeline.
+        def walk(start, adjacent_first):
+            path = []
+            el = start
+            adjacent = adjacent_first
+            while True:
+                el = el.adjacent_edgeline() if adjacent else el.connected_edgeline()
+                if el is None or el == start:
+                    return path, el is not None
+                path.append(el)
+                adjacent = not adjacent
+
+        forward, is_cycle = walk(edgeline, True)
+        if is_cycle:
+            start = min((el for el in [edgeline] + forward if el.side == EdgeLineSide.UPPER),
+                        key=self.edgeline_order)
+            edgelines = [start] + walk(start, False)[0]
+            location = Location.INTERIOR
+        else:
+            backward, _ = walk(edgeline, False)
+            edgelines = list(reversed(backward)) + [edgeline] + forward
+            # start with a lower boundary edgeline or an upper edgeline, as get_next_boundary_edgeline does
+            ends = [edgelines[0], edgelines[-1]]
+            if min(ends, key=lambda el: (not (el.edge is None and el.side == EdgeLineSide.LOWER or
+                                               el.edge is not None and el.side == EdgeLineSide.UPPER),
+                                         self.edgeline_order(el))) is ends[1]:
+                edgelines.reverse()
+            location = Location.BOUNDARY
+        face = Face(None, location, edgelines).freeze()
+        with _lock:
+            # another thread may have walked the same face in the meantime; keep the face it found
+            if edgeline in self.face_cache:
+                return self.face_cache[edgeline]
+            for el in edgelines:
+                self.face_cache[el] = face
+        return face
+
+    def boundary_component_of(self, edge_index, side=None):
+        """
+            The boundary component containing a face through the given edge (edge_index is None for a boundary
+            edgeline), or None if the faces through it are interior faces.  If side is not given, the upper
+            edgeline is tried first.
+
+            Like face_of, this only visits the faces of the boundary component, going from one face to the next
+            with touching_boundary_edgeline.  The component starts with the face through the given edge.
+        """
+        sides = [side] if side is not None else [EdgeLineSide.UPPER, EdgeLineSide.LOWER]
+        face = None
+        for s in sides:
+            if self.has_edgeline(edge_index, s):
+                face = self.face_of(edge_index, s)
+                if face.location == Location.BOUNDARY:
+                    break
+        if face is None or face.location != Location.BOUNDARY:
+            return None
+        if id(face) in self.boundary_component_cache:
+            return self.boundary_component_cache[id(face)]
+
+        component = BoundaryComponent()
+        exit_edgeline = face.edgelines[-1]
+        current = face
+        while True:
+            component.add_face(current)
+            entry = exit_edgeline.touching_boundary_edgeline()
+            current = self.face_of(None if entry.edge is None else entry.edge.index, entry.side)
+            if current is face:
+                break
+            exit_edgeline = current.edgelines[-1] if current.edgelines[0] == entry else current.edgelines[0]
+        component.freeze()
+        with _lock:
+            if id(face) in self.boundary_component_cache:
+                return self.boundary_component_cache[id(face)]
+            for f in component.faces:
+                self.boundary_component_cache[id(f)] = component
+        return component
+
+    def canonical_string(self):
+        """
+            The symbol string as enumerate_symbols writes it: half arms or half band first, then the other features
+            in order of their first edge, with no spaces.
+        """
+        m = self.num_edges
+        features = []
+        for edge in self.edges:
+            if edge.feature in (DoilyFeature.HALF_ARM, DoilyFeature.HALF_BAND) or \
+                    (edge.endpoint is not None and edge.endpoint < edge.index):
+                continue
+            features.append(_SymbolShape.feature_string(edge.feature, edge.index, edge.endpoint))
+        if self.has_half_band:
+            return '<0,%d>' % (m - 1) + ''.join(features) + '*'
+        elif self.num_half_arms == 2:
+            return '<0>' + ''.join(features) + '<%d>*' % (m - 1)
+        elif self.num_half_arms == 1:
+            return '<0>' + ''.join(features) + '*'
+        return ''.join(features) + ('.' if self.local_symmetry == Location.INTERIOR else '*')
+
+    def face_info_record(self):
+        """
+            The faces, face code and orbifold of this symbol in the format of the symbol table (see
+            build_symbol_table): tab-separated fields with
+                the edgelines of each face, boundary faces first, numbered 2 * edge + side, or 2m + side for the
+                    boundary edgelines
+                the number of faces in each boundary component
+                the number of sides of each face
+                the face code, by position in the list of faces
+                the handles and crosscaps, gyrations and kaleidoscopes of the orbifold
+        """
+        faces = [f for bc in self.boundary_components for f in bc.faces] + list(self.interior_faces)
+        number = dict((f.index, k) for k, f in enumerate(faces))
+        m = self.num_edges
+
+        def edgeline_code(el):
+            return '%d' % (2 * (m if el.edge is None else el.edge.index) + el.side)
+        orbifold = self.orbifold
+        return '\t'.join([' '.join(','.join(edgeline_code(el) for el in f.edgelines) for f in faces),
+                          ','.join('%d' % len(bc.faces) for bc in self.boundary_components),
+                          ','.join('%d' % f.number_of_sides() for f in faces),
+                          ','.join('%d' % number[index] for _, index in self.face_code),
+                          '%d,%d;%s;%s' % (orbifold.handles, orbifold.crosscaps, ','.join(map(str, orbifold.gyrations)),
+                                           '|'.join(','.join(map(str, k)) for k in orbifold.kaleidoscopes))])
+
+    def set_face_info_from_record(self, record):
+        # The Face objects are only built when boundary_components or interior_faces is first used (see
+        # __getattr__), since most lookups only want the face code or the orbifold.
+        faces_field, components_field, sides_field, face_code_field, orbifold_field = record.split('\t')
+        self.face_record = (faces_field, components_field)
+        sides = [int(s) for s in sides_field.split(',')]
+        self.num_faces = len(sides)
+        self.face_code = tuple((sides[k], k) for k in map(int, face_code_field.split(',')))
+
+        def parameter(token):
+            return int(token) if token.isdigit() else token
+        counts, gyrations, kaleidoscopes = orbifold_field.split(';')
+        handles, crosscaps = map(int, counts.split(','))
+        self.orbifold = Orbifold([parameter(g) for g in gyrations.split(',') if g],
+                                 [[parameter(x) for x in k.split(',') if x] for k in kaleidoscopes.split('|')]
+                                 if components_field else [], handles, crosscaps)
+
+    def set_faces_from_record(self, faces_field, components_field):
+        m = self.num_edges
+        faces = []
+        for edgelines in faces_field.split(' '):
+            faces.append([EdgeLine(code >> 1 if code < 2 * m else None, code & 1, self)
+                          for code in map(int, edgelines.split(','))])
+        boundary_components = []
+        num_faces = 0
+        for size in (map(int, components_field.split(',')) if components_field else []):
+            bc = BoundaryComponent()
+            for k in range(num_faces, num_faces + size):
+                bc.add_face(Face(k, Location.BOUNDARY, faces[k]))
+            boundary_components.append(bc.freeze())
+            num_faces += size
+        self.boundary_components = tuple(boundary_components)
+        self.interior_faces = tuple(Face(k, Location.INTERIOR, faces[k]).freeze()
+                                    for k in range(num_faces, len(faces)))
+
+    def __setattr__(self, name, value):
+        if name in PermutationSymbol._COMPUTED_ATTRIBUTES and name in self.__dict__:
+            raise AttributeError('The %s of a PermutationSymbol cannot be changed after it is computed' % name)
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if name in PermutationSymbol._COMPUTED_ATTRIBUTES and name in self.__dict__:
+            raise AttributeError('The %s of a PermutationSymbol cannot be changed after it is computed' % name)
+        object.__delattr__(self, name)
+
+    def __getattr__(self, name):
+        # only called for missing attributes
+        if name in ('boundary_components', 'interior_faces'):
+            with _lock:
+                # the record is only dropped once both attributes are set, so other threads wait here and then
+                # find them
+                if 'face_record' in self.__dict__:
+                    self.set_faces_from_record(*self.__dict__['face_record'])
+                    del self.__dict__['face_record']
+            if name in self.__dict__:
+                return self.__dict__[name]
+        raise AttributeError("'PermutationSymbol' object has no attribute '%s'" % name)
+
+    def set_face_info(self, use_table=True):
+        """
+            Compute the faces, face code and orbifold, or look them up in the symbol table (see use_symbol_table)
+            if the symbol is there and use_table is True.
+        """
+        # forget the faces found by face_of and boundary_component_of, which have no index
+        self.face_cache = {}
+        self.boundary_component_cache = {}
+        if use_table:
+            record = _symbol_table.lookup(self.symbol_string)
+            if record is None and _symbol_table.filename is not None:
+                record = _symbol_table.lookup(self.canonical_string())
+            if record is not None:
+                self.set_face_info_from_record(record)
+                return
+
         all_edgelines = self.get_all_edgelines()
         copy_all_edgelines = [x for x in all_edgelines]  # we'll be destroying all_edgelines throughout the algorithm
 
         edgeline_to_face = {}
-        self.boundary_components = self.get_boundary_components(all_edgelines, edgeline_to_face)
+        self.boundary_components = tuple(bc.freeze() for bc in
+                                         self.get_boundary_components(all_edgelines, edgeline_to_face))
         num_faces = sum([len(x.faces) for x in self.boundary_components])
-        self.interior_faces = self.get_interior_faces(all_edgelines, edgeline_to_face, num_faces)
+        self.interior_faces = tuple(face.freeze() for face in
+                                    self.get_interior_faces(all_edgelines, edgeline_to_face, num_faces))
         num_faces += len(self.interior_faces)
         self.num_faces = num_faces
 
         self.face_code = self.get_face_code(copy_all_edgelines, edgeline_to_face)
+        del copy_all_edgelines, edgeline_to_face  # not needed for the orbifold, so not part of the peak
+
+        self.orbifold = self.get_orbifold()
+
+
+class _PartialFaces:
+    """
+        The faces of a partially assigned permutation symbol.
+
+        Every edgeline belongs to exactly one pair of adjacent edgelines, and the faces of the orbifold are the
+        components obtained by joining these pairs through connected edgelines.  The pairs are numbered in the
+        order in which they appear in the face code, and the components are kept in a union-find structure.
+        Every mutation is recorded, so that rollback() can undo all work done after a checkpoint().
+
+        For each component we keep (at its root):
+            size: the number of adjacent edgeline pairs
+            boundary_edgelines: the number of boundary edgelines (BL or BU) in the component
+            ends: the number of edgelines of the component which meet the boundary
+            open_edgelines: the number of edgelines of the component whose edge has not been assigned yet
+        A component is closed when it has no open edgelines.
+    """
+    def __init__(self, num_pairs):
+        self.parent = list(range(num_pairs))
+        self.size = [1] * num_pairs
+        self.boundary_edgelines = [0] * num_pairs
+        self.ends = [0] * num_pairs
+        self.open_edgelines = [2] * num_pairs
+        self.history = []
+
+    def _set(self, array, index, value):
+        self.history.append((array, index, array[index]))
+        array[index] = value
+
+    def checkpoint(self):
+        return len(self.history)
+
+    def rollback(self, checkpoint):
+        history = self.history
+        while len(history) > checkpoint:
+            array, index, value = history.pop()
+            array[index] = value
+
+    def find(self, pair):
+        parent = self.parent
+        while parent[pair] != pair:
+            pair = parent[pair]
+        return pair
+
+    def add_boundary_edgeline(self, pair):
+        root = self.find(pair)
+        self._set(self.boundary_edgelines, root, self.boundary_edgelines[root] + 1)
+        return self.end(pair)
+
+    def end(self, pair):
+        # The edgeline in this pair meets the boundary, so the face stops there.
+        root = self.find(pair)
+        self._set(self.ends, root, self.ends[root] + 1)
+        self._set(self.open_edgelines, root, self.open_edgelines[root] - 1)
+        return root
+
+    def connect(self, pair1, pair2):
+        root1 = self.find(pair1)
+        root2 = self.find(pair2)
+        if root1 == root2:
+            self._set(self.open_edgelines, root1, self.open_edgelines[root1] - 2)
+            return root1
+        if self.size[root1] < self.size[root2]:
+            root1, root2 = root2, root1
+        self._set(self.parent, root2, root1)
+        self._set(self.size, root1, self.size[root1] + self.size[root2])
+        self._set(self.boundary_edgelines, root1, self.boundary_edgelines[root1] + self.boundary_edgelines[root2])
+        self._set(self.ends, root1, self.ends[root1] + self.ends[root2])
+        self._set(self.open_edgelines, root1, self.open_edgelines[root1] + self.open_edgelines[root2] - 2)
+        return root1
+
+    def is_closed(self, root):
+        return self.open_edgelines[root] == 0
+
+    def number_of_sides(self, root):
+        # Same as Face.number_of_sides: a boundary face counts every non-boundary edgeline, an interior face
+        # counts every pair.
+        if self.ends[root] > 0:
+            return 2 * self.size[root] - self.boundary_edgelines[root]
+        return self.size[root]
+
+
+class _SymbolShape:
+    """
+        The part of a permutation symbol which is fixed before any free edge is assigned: the number of edges,
+        the local symmetry, and the half arms or half band.  It knows how edgelines are grouped into adjacent
+        pairs, and which face code positions each pair occupies (see PermutationSymbol.get_face_code).
+    """
+    DOT = 0
+    STAR = 1
+    ONE_HALF_ARM = 2
+    TWO_HALF_ARMS = 3
+    HALF_BAND = 4
+
+    def __init__(self, kind, num_edges):
+        self.kind = kind
+        self.num_edges = m = num_edges
+
+        # pair_of[(edge, side)] gives the adjacent pair containing that edgeline; None is the boundary edgeline.
+        self.pair_of = {}
+        if kind == _SymbolShape.DOT:
+            for i in range(m):
+                self.pair_of[(i, EdgeLineSide.UPPER)] = i
+                self.pair_of[((i + 1) % m, EdgeLineSide.LOWER)] = i
+            self.face_code_pairs = list(range(m))
+        elif kind == _SymbolShape.STAR:
+            self.pair_of[(None, EdgeLineSide.LOWER)] = 0
+            self.pair_of[(0, EdgeLineSide.LOWER)] = 0
+            for i in range(m):
+                self.pair_of[(i, EdgeLineSide.UPPER)] = i + 1
+                if i < m - 1:
+                    self.pair_of[(i + 1, EdgeLineSide.LOWER)] = i + 1
+            self.pair_of[(None, EdgeLineSide.UPPER)] = m
+            self.face_code_pairs = list(range(1, m + 1)) + list(range(m - 1, 0, -1)) + [0]
+        elif kind == _SymbolShape.ONE_HALF_ARM:
+            for i in range(m):
+                self.pair_of[(i, EdgeLineSide.UPPER)] = i
+                if i < m - 1:
+                    self.pair_of[(i + 1, EdgeLineSide.LOWER)] = i
+            self.pair_of[(None, EdgeLineSide.UPPER)] = m - 1
+            self.face_code_pairs = list(range(m)) + list(range(m - 2, -1, -1))
+        else:  # two half arms or half band
+            for i in range(m - 1):
+                self.pair_of[(i, EdgeLineSide.UPPER)] = i
+                self.pair_of[(i + 1, EdgeLineSide.LOWER)] = i
+            self.face_code_pairs = list(range(m - 1)) + list(range(m - 2, -1, -1))
+        self.num_pairs = max(self.pair_of.values()) + 1
+
+        if kind == _SymbolShape.ONE_HALF_ARM:
+            self.prefix = '<0>'
+            self.free_edges = list(range(1, m))
+        elif kind == _SymbolShape.TWO_HALF_ARMS:
+            self.prefix = '<0>'
+            self.free_edges = list(range(1, m - 1))
+        elif kind == _SymbolShape.HALF_BAND:
+            self.prefix = '<0,%d>' % (m - 1)
+            self.free_edges = list(range(1, m - 1))
+        else:
+            self.prefix = ''
+            self.free_edges = list(range(m))
+        self.suffix = ('<%d>*' % (m - 1)) if kind == _SymbolShape.TWO_HALF_ARMS else \
+            ('.' if kind == _SymbolShape.DOT else '*')
 
-        self.orbifold = self.get_orbifold()
\ No newline at end of file
+    @staticmethod
+    def shapes_for_face_code_length(length):
+        """
+            All shapes whose face codes have the given length.  A symbol with m edges has a face code of length
+            m if its local symmetry is '.', 2m if it is '*' without half arms or half band, 2m - 1 with one half
+            arm, and 2m - 2 with two half arms or a half band.
+        """
+        shapes = []
+        if length >= 1:
+            shapes.append(_SymbolShape(_SymbolShape.DOT, length))
+        if length >= 2 and length % 2 == 0:
+            shapes.append(_SymbolShape(_SymbolShape.STAR, length // 2))
+        if length % 2 == 1:
+            shapes.append(_SymbolShape(_SymbolShape.ONE_HALF_ARM, (length + 1) // 2))
+        if length >= 2 and length % 2 == 0:
+            shapes.append(_SymbolShape(_SymbolShape.TWO_HALF_ARMS, (length + 2) // 2))
+            shapes.append(_SymbolShape(_SymbolShape.HALF_BAND, (length + 2) // 2))
+        return shapes
+
+    @staticmethod
+    def shapes_for_num_edges(num_edges):
+        """
+            All shapes of symbols with the given number of edges.
+        """
+        shapes = [_SymbolShape(_SymbolShape.DOT, num_edges), _SymbolShape(_SymbolShape.STAR, num_edges),
+                  _SymbolShape(_SymbolShape.ONE_HALF_ARM, num_edges)]
+        if num_edges >= 2:
+            shapes.append(_SymbolShape(_SymbolShape.TWO_HALF_ARMS, num_edges))
+            shapes.append(_SymbolShape(_SymbolShape.HALF_BAND, num_edges))
+        return shapes
+
+    def new_partial_faces(self):
+        """
+            Return a _PartialFaces for this shape in which everything except the free edges has been assigned.
+        """
+        partial_faces = _PartialFaces(self.num_pairs)
+        for (edge, side), pair in self.pair_of.items():
+            if edge is None:
+                partial_faces.add_boundary_edgeline(pair)
+        m = self.num_edges
+        if self.kind in (_SymbolShape.ONE_HALF_ARM, _SymbolShape.TWO_HALF_ARMS):
+            partial_faces.end(self.pair_of[(0, EdgeLineSide.UPPER)])
+        if self.kind == _SymbolShape.TWO_HALF_ARMS:
+            partial_faces.end(self.pair_of[(m - 1, EdgeLineSide.LOWER)])
+        if self.kind == _SymbolShape.HALF_BAND:
+            partial_faces.connect(self.pair_of[(0, EdgeLineSide.UPPER)], self.pair_of[(m - 1, EdgeLineSide.LOWER)])
+        return partial_faces
+
+    def assign(self, partial_faces, feature, index, endpoint=None):
+        """
+            Assign a feature to a free edge (and its endpoint, for bands).  Return the roots of the components
+            touched by the assignment.
+        """
+        pair_of = self.pair_of
+        upper = EdgeLineSide.UPPER
+        lower = EdgeLineSide.LOWER
+        if feature == DoilyFeature.ROTARY_ARM:
+            return [partial_faces.connect(pair_of[(index, upper)], pair_of[(index, lower)])]
+        elif feature == DoilyFeature.FOLDED_BAND:
+            return [partial_faces.end(pair_of[(index, upper)]), partial_faces.end(pair_of[(index, lower)])]
+        elif feature == DoilyFeature.UNTWISTED_BAND:
+            return [partial_faces.connect(pair_of[(index, upper)], pair_of[(endpoint, lower)]),
+                    partial_faces.connect(pair_of[(endpoint, upper)], pair_of[(index, lower)])]
+        elif feature == DoilyFeature.TWISTED_BAND:
+            return [partial_faces.connect(pair_of[(index, upper)], pair_of[(endpoint, upper)]),
+                    partial_faces.connect(pair_of[(index, lower)], pair_of[(endpoint, lower)])]
+        assert False, 'Only rotary arms, folded bands and bands can be assigned to free edges'
+
+    @staticmethod
+    def feature_string(feature, index, endpoint=None):
+        if feature == DoilyFeature.ROTARY_ARM:
+            return '(%d)' % index
+        elif feature == DoilyFeature.FOLDED_BAND:
+            return '[%d]' % index
+        elif feature == DoilyFeature.UNTWISTED_BAND:
+            return '(%d,%d)' % (index, endpoint)
+        elif feature == DoilyFeature.TWISTED_BAND:
+            return '[%d,%d]' % (index, endpoint)
+        assert False, 'Only rotary arms, folded bands and bands can be assigned to free edges'
+
+
+def parse_face_code(face_code_string):
+    """
+        Parse a comma-separated face code in the notation of the tables in SoT and test_cases.txt, such as
+        8b,a,8b,8b,8b or (7a)^3,b,(7a)^8, into a list of pairs (number_of_sides, parameter):
+        [(8, 'b'), (1, 'a'), (8, 'b'), (8, 'b'), (8, 'b')]
+    """
+    face_code = []
+    for face_group in face_code_string.split(','):
+        face_group = face_group.strip()
+        m = re.match('^([0-9]+)?([a-z])$', face_group)  # match something like 7a or b
+        count = 1
+        if m is None:
+            m = re.match('^\\(([0-9]+)?([a-z])\\)\\^([0-9]+)$', face_group)  # match something like (7a)^3
+            if m is None:
+                raise ValueError('Invalid face %s in face code %s' % (face_group, face_code_string))
+            count = int(m.group(3))
+        sides = int(m.group(1)) if m.group(1) else 1
+        face_code.extend([(sides, m.group(2))] * count)
+    return face_code
+
+
+def normalize_face_code(face_code):
+    """
+        Renumber the parameters of a face code (a face code string, or a list of pairs (number_of_sides, parameter)
+        such as PermutationSymbol.face_code) in order of first appearance.  Two face codes describe the same
+        vertex pattern exactly when their normalized face codes are equal.
+
+        For example, [(8, 3), (1, 2), (8, 3)] and 8b,a,8b both normalize to [(8, 0), (1, 1), (8, 0)].
+    """
+    if isinstance(face_code, str):
+        face_code = parse_face_code(face_code)
+    normalization_map = {}
+    normalized = []
+    for sides, parameter in face_code:
+        if parameter not in normalization_map:
+            normalization_map[parameter] = len(normalization_map)
+        normalized.append((sides, normalization_map[parameter]))
+    return normalized
+
+
+def find_symbols_by_face_code(face_code):
+    """
+        Generate every permutation symbol whose face code matches the given face code (a face code string such
+        as 3a,b,3a,3a, or a list of pairs like PermutationSymbol.face_code) up to renaming of the parameters.
+
+        This is a branch-and-bound search.  For each possible shape of symbol (see _SymbolShape), the free edges
+        are assigned one at a time, and the faces which close as a result are compared with the target: a face
+        must cover exactly the face code positions of one parameter, with the right number of sides, and two
+        positions with different parameters can never end up in the same face.  Each candidate that survives is
+        checked against the full decomposition before it is yielded.
+    """
+    target = normalize_face_code(face_code)
+    for shape in _SymbolShape.shapes_for_face_code_length(len(target)):
+        # Every pair must carry a single parameter, wherever it appears in the face code.
+        pair_parameter = [None] * shape.num_pairs
+        parameter_sides = {}
+        parameter_num_pairs = {}
+        consistent = True
+        for (sides, parameter), pair in zip(target, shape.face_code_pairs):
+            if pair_parameter[pair] is None:
+                pair_parameter[pair] = parameter
+                parameter_num_pairs[parameter] = parameter_num_pairs.get(parameter, 0) + 1
+            if pair_parameter[pair] != parameter or parameter_sides.setdefault(parameter, sides) != sides:
+                consistent = False
+                break
+        if not consistent:
+            continue
+
+        for symbol_string in _search_face_code(shape, pair_parameter, parameter_sides, parameter_num_pairs):
+            ps = PermutationSymbol(symbol_string)
+            if normalize_face_code(ps.face_code) == target:
+                yield ps
+
+
+def _search_face_code(shape, pair_parameter, parameter_sides, parameter_num_pairs):
+    partial_faces = shape.new_partial_faces()
+
+    def consistent(roots):
+        for root in roots:
+            root = partial_faces.find(root)
+            parameter = pair_parameter[root]
+            if partial_faces.ends[root] > 0 and not parameter_on_boundary[parameter]:
+                return False
+            if partial_faces.is_closed(root):
+                if partial_faces.size[root] != parameter_num_pairs[parameter]:
+                    return False
+                if partial_faces.number_of_sides(root) != parameter_sides[parameter]:
+                    return False
+        return True
+
+    def parameters_agree(pair1, pair2):
+        return pair_parameter[partial_faces.find(pair1)] == pair_parameter[partial_faces.find(pair2)]
+
+    # A face is a boundary face exactly when it has an edgeline meeting the boundary.  Since the face of a
+    # parameter must contain all of its pairs, we know which kind of face each parameter needs.
+    parameter_boundary_edgelines = dict((parameter, 0) for parameter in parameter_sides)
+    for (edge, side), pair in shape.pair_of.items():
+        if edge is None:
+            parameter_boundary_edgelines[pair_parameter[pair]] += 1
+    parameter_on_boundary = {}
+    for parameter, sides in parameter_sides.items():
+        num_pairs = parameter_num_pairs[parameter]
+        boundary_edgelines = parameter_boundary_edgelines[parameter]
+        if boundary_edgelines == 0 and sides == num_pairs:
+            parameter_on_boundary[parameter] = False
+        elif sides == 2 * num_pairs - boundary_edgelines:
+            parameter_on_boundary[parameter] = True
+        else:
+            return
+
+    # The shape itself may already close (or merge) some faces.
+    for pair in range(shape.num_pairs):
+        if pair_parameter[pair] != pair_parameter[partial_faces.find(pair)]:
+            return
+    if not consistent(range(shape.num_pairs)):
+        return
+
+    pair_of = shape.pair_of
+    upper = EdgeLineSide.UPPER
+    lower = EdgeLineSide.LOWER
+
+    def allowed(feature, i, j):
+        # Faces carrying different parameters can never be joined, so reject those before touching the state.
+        if feature == DoilyFeature.ROTARY_ARM:
+            links = [((i, upper), (i, lower))]
+        elif feature == DoilyFeature.UNTWISTED_BAND:
+            links = [((i, upper), (j, lower)), ((j, upper), (i, lower))]
+        elif feature == DoilyFeature.TWISTED_BAND:
+            links = [((i, upper), (j, upper)), ((i, lower), (j, lower))]
+        else:
+            links = []
+        return all(parameters_agree(pair_of[a], pair_of[b]) for a, b in links)
+
+    for symbol_string in _search_features(shape, partial_faces, consistent, allowed):
+        yield symbol_string
+
+
+def _search_features(shape, partial_faces, accepted, allowed=None):
+    """
+        Depth-first search over the assignments of features to the free edges of shape, starting from
+        partial_faces, in the order of enumerate_symbols within the shape.  The free edges are assigned in order,
+        each one as a rotary arm, a folded band, or a band to a later unassigned free edge, and every assignment is
+        rolled back when the search backtracks, so symbols which share a prefix of features share the work for it.
+
+        allowed(feature, index, endpoint), if given, can reject a choice before it is assigned; accepted(roots) is
+        called with the roots of the components touched by an assignment, and cuts the branch if it returns False.
+        Yield the symbol string of each complete assignment, while partial_faces holds its faces.
+    """
+    free_edges = shape.free_edges
+    assigned = [False] * shape.num_edges
+    features = []
+
+    def search(position):
+        while position < len(free_edges) and assigned[free_edges[position]]:
+            position += 1
+        if position == len(free_edges):
+            # features were assigned in order of their first edge, as enumerate_symbols writes them
+            yield shape.prefix + ''.join(features) + shape.suffix
+            return
+        i = free_edges[position]
+        assigned[i] = True
+        choices = [(DoilyFeature.ROTARY_ARM, None), (DoilyFeature.FOLDED_BAND, None)]
+        for j in free_edges[position + 1:]:
+            if not assigned[j]:
+                choices.append((DoilyFeature.UNTWISTED_BAND, j))
+                choices.append((DoilyFeature.TWISTED_BAND, j))
+        for feature, j in choices:
+            if allowed is not None and not allowed(feature, i, j):
+                continue
+            checkpoint = partial_faces.checkpoint()
+            if accepted(shape.assign(partial_faces, feature, i, j)):
+                if j is not None:
+                    assigned[j] = True
+                features.append(_SymbolShape.feature_string(feature, i, j))
+                for symbol_string in search(position + 1):
+                    yield symbol_string
+                features.pop()
+                if j is not None:
+                    assigned[j] = False
+            partial_faces.rollback(checkpoint)
+        assigned[i] = False
+
+    return search(0)
+
+
+def enumerate_symbols(num_edges):
+    """
+        Generate the strings of all valid permutation symbols with the given number of edges, normalized as in
+        notes.txt: a single half arm is always edge 0.
+    """
+    for shape in _SymbolShape.shapes_for_num_edges(num_edges):
+        for features in _free_edge_features(shape.free_edges):
+            yield shape.prefix + ''.join(features) + shape.suffix
+
+
+def _free_edge_features(free_edges):
+    # each free edge is a rotary arm or a folded band, or is joined with a later free edge by a band
+    if not free_edges:
+        yield []
+        return
+    i = free_edges[0]
+    rest = free_edges[1:]
+    for features in _free_edge_features(rest):
+        yield ['(%d)' % i] + features
+        yield ['[%d]' % i] + features
+    for k, j in enumerate(rest):
+        for features in _free_edge_features(rest[:k] + rest[k + 1:]):
+            yield ['(%d,%d)' % (i, j)] + features
+            yield ['[%d,%d]' % (i, j)] + features
+
+
+def enumerate_face_codes(num_edges, face_filter=None):
+    """
+        Generate a pair (symbol string, face code) for each valid symbol with the given number of edges: the same
+        symbols as enumerate_symbols, in a different order, with each face code normalized as by
+        normalize_face_code.
+
+        This is the depth-first search of _search_features over each shape (see _SymbolShape), following the faces
+        in a _PartialFaces as they grow and close.  Symbols which share a prefix of features share the work for it,
+        so a symbol costs only the assignment of its last edges and the reading of its face code, with no
+        PermutationSymbol built.
+
+        face_filter(number_of_sides, location) is called for each face as soon as it closes, with location
+        Location.BOUNDARY or Location.INTERIOR.  If it returns False, no symbol containing that face can be
+        generated, and the whole branch is cut at once.
+    """
+    for shape in _SymbolShape.shapes_for_num_edges(num_edges):
+        for symbol_string, face_code in _search_shape(shape, face_filter):
+            yield symbol_string, face_code
+
+
+def _search_shape(shape, face_filter):
+    partial_faces = shape.new_partial_faces()
+
+    def accepted(roots):
+        if face_filter is None:
+            return True
+        for root in set(partial_faces.find(root) for root in roots):
+            if partial_faces.is_closed(root):
+                location = Location.BOUNDARY if partial_faces.ends[root] > 0 else Location.INTERIOR
+                if not face_filter(partial_faces.number_of_sides(root), location):
+                    return False
+        return True
+
+    def face_code():
+        roots = [partial_faces.find(pair) for pair in shape.face_code_pairs]
+        numbers = {}
+        return [(partial_faces.number_of_sides(root), numbers.setdefault(root, len(numbers))) for root in roots]
+
+    # The shape itself may already close some faces.
+    if not accepted(range(shape.num_pairs)):
+        return
+    for symbol_string in _search_features(shape, partial_faces, accepted):
+        yield symbol_string, face_code()
+
+
+def _free_edge_feature_counts(num_free_edges):
+    # counts[k] is the number of ways _free_edge_features can assign k free edges: the first edge is a rotary arm
+    # or a folded band (2 * counts[k - 1]), or a band of either kind to one of the k - 1 others
+    counts = [1, 2]
+    for k in range(2, num_free_edges + 1):
+        counts.append(2 * counts[k - 1] + 2 * (k - 1) * counts[k - 2])
+    return counts[:num_free_edges + 1]
+
+
+def count_symbols(num_edges):
+    """
+        The number of symbols generated by enumerate_symbols(num_edges), computed without generating them.
+    """
+    return sum(_free_edge_feature_counts(len(shape.free_edges))[-1]
+               for shape in _SymbolShape.shapes_for_num_edges(num_edges))
+
+
+def unrank_symbol(num_edges, rank):
+    """
+        The symbol string at position rank (counting from 0) in enumerate_symbols(num_edges), computed without
+        generating the symbols before it.
+    """
+    if not 0 <= rank < count_symbols(num_edges):
+        raise ValueError('There are %d symbols with %d edges, so there is no symbol %d' %
+                         (count_symbols(num_edges), num_edges, rank))
+    for shape in _SymbolShape.shapes_for_num_edges(num_edges):
+        counts = _free_edge_feature_counts(len(shape.free_edges))
+        if rank >= counts[-1]:
+            rank -= counts[-1]
+            continue
+        # Undo the nesting of _free_edge_features one free edge at a time.
+        features = []
+        rest = list(shape.free_edges)
+        while rest:
+            i = rest.pop(0)
+            singles = 2 * counts[len(rest)]
+            if rank < singles:
+                rank, folded = divmod(rank, 2)
+                features.append(('[%d]' if folded else '(%d)') % i)
+            else:
+                k, rank = divmod(rank - singles, 2 * counts[len(rest) - 1])
+                rank, twisted = divmod(rank, 2)
+                features.append(('[%d,%d]' if twisted else '(%d,%d)') % (i, rest.pop(k)))
+        return shape.prefix + ''.join(features) + shape.suffix
+
+
+def random_symbol(num_edges, rng=None):
+    """
+        A symbol string chosen uniformly at random from enumerate_symbols(num_edges), using the given random.Random
+        (or the random module).  Each symbol is drawn by choosing its rank, so there is no rejection.
+    """
+    return unrank_symbol(num_edges, (rng or random).randrange(count_symbols(num_edges)))
+
+
+class _SymbolTable:
+    """
+        A table of the face information of all valid symbols up to some number of edges, written by
+        build_symbol_table.  The file has a header line with SYMBOL_TABLE_FORMAT, then one line per symbol: the
+        canonical symbol string and its face_info_record, separated by a tab.
+
+        Nothing is read until the first lookup, which checks the header, memory-maps the file and indexes the offsets
+        of its lines by symbol.  Later lookups are a dictionary probe and the decoding of one line.  A file with
+        another format, such as a table built by an older version whose results may be wrong, or an empty file, is
+        ignored with a warning.
+    """
+    HEADER_RE = re.compile(b'# archimedean_tilings symbol table, format ([0-9]+), max_edges=[0-9]+\n')
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.index = None
+        self.data = None
+
+    def load(self):
+        """
+            Read the table, and return whether it has the current format.
+        """
+        with open(self.filename, 'rb') as f:
+            match = _SymbolTable.HEADER_RE.fullmatch(f.readline())
+            if match is None or int(match.group(1)) != SYMBOL_TABLE_FORMAT:
+                return False
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index = {}
+        position = match.end()  # skip the header
+        while position < len(data):
+            tab = data.find(b'\t', position)
+            end = data.find(b'\n', tab)
+            index[data[position:tab]] = (tab + 1, end)
+            position = end + 1
+        # publish the index last: lookups in other threads treat a table with an index as loaded
+        self.data = data
+        self.index = index
+        return True
+
+    def lookup(self, symbol_string):
+        if self.filename is None:
+            return None
+        if self.index is None:
+            with _lock:
+                if self.filename is not None and self.index is None:
+                    if not os.path.exists(self.filename):
+                        self.filename = None
+                    elif not self.load():
+                        warnings.warn('Ignoring the symbol table %s, which is not in format %d; rebuild it with '
+                                      'build_symbol_table' % (self.filename, SYMBOL_TABLE_FORMAT))
+                        self.filename = None
+            if self.index is None:
+                return None
+        location = self.index.get(symbol_string.encode())
+        if location is None:
+            return None
+        return self.data[location[0]:location[1]].decode()
+
+
+SYMBOL_TABLE_ENVIRONMENT_VARIABLE = 'ARCHIMEDEAN_TILINGS_SYMBOL_TABLE'
+# Increase this whenever the records change, or the results they hold would differ, so that older tables are ignored.
+SYMBOL_TABLE_FORMAT = 1
+_symbol_table = _SymbolTable(os.environ.get(SYMBOL_TABLE_ENVIRONMENT_VARIABLE,
+                                            os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         'symbol_table.txt')))
+
+
+def use_symbol_table(filename):
+    """
+        Make PermutationSymbol look up faces in the given symbol table file, or in no table if filename is None.
+        By default, the table is the file named by the environment variable ARCHIMEDEAN_TILINGS_SYMBOL_TABLE, or
+        symbol_table.txt next to this module, if it exists.
+    """
+    global _symbol_table
+    _symbol_table = _SymbolTable(filename)
+
+
+def build_symbol_table(filename, max_edges):
+    """
+        Write the table of all valid symbols with up to max_edges edges to the given file.  8 edges covers the
+        symbols of SoT, with 93339 symbols in about 11 MB.
+    """
+    with open(filename, 'w') as f:
+        f.write('# archimedean_tilings symbol table, format %d, max_edges=%d\n' % (SYMBOL_TABLE_FORMAT, max_edges))
+        for m in range(1, max_edges + 1):
+            for symbol_string in enumerate_symbols(m):
+                ps = PermutationSymbol(symbol_string, face_info=False)
+                ps.set_face_info(use_table=False)
+                f.write('%s\t%s\n' % (symbol_string, ps.face_info_record()))
+
+
+def _orbifold_only(ps):
+    return ps.orbifold_only()
+
+
+def orbifolds_only(symbol_strings, workers=1, mode=None):
+    """
+        The list of orbifolds of the given symbol strings, computed with PermutationSymbol.orbifold_only.  With
+        more than one worker they are computed by map_symbols.
+    """
+    return map_symbols(_orbifold_only, symbol_strings, workers, mode, face_info=False)
+
+
+def is_free_threaded():
+    """
+        Whether this Python runs threads in parallel, as a free-threaded build (3.13t and later) without the GIL does.
+    """
+    return not getattr(sys, '_is_gil_enabled', lambda: True)()
+
+
+def _apply_to_symbols(arguments):
+    function, symbol_strings, face_info = arguments
+    return [function(PermutationSymbol(symbol_string, face_info)) for symbol_string in symbol_strings]
+
+
+def map_symbols(function, symbol_strings, workers=None, mode=None, chunk_size=64, face_info=True):
+    """
+        Return the list of function(PermutationSymbol(s, face_info)) for the given symbol strings, in order,
+        computed in chunks by a pool of workers (one per CPU if workers is None).
+
+        mode is 'thread', 'process' or None.  Threads share the symbol table and need no pickling, so small symbols
+        cost little more than in a loop; on a free-threaded Python they also run in parallel, and None chooses them
+        there.  Otherwise None chooses processes, which need function to be importable and its results to be
+        picklable.  With workers=1 everything runs in this thread.
+    """
+    if mode is None:
+        mode = 'thread' if is_free_threaded() else 'process'
+    if mode not in ('thread', 'process'):
+        raise ValueError("mode must be 'thread', 'process' or None, not %r" % (mode,))
+    symbol_strings = list(symbol_strings)
+    chunks = [(function, symbol_strings[i:i + chunk_size], face_info)
+              for i in range(0, len(symbol_strings), chunk_size)]
+    if workers == 1:
+        results = map(_apply_to_symbols, chunks)
+        pool = None
+    else:
+        pool = multiprocessing.pool.ThreadPool(workers) if mode == 'thread' else multiprocessing.Pool(workers)
+        results = pool.imap(_apply_to_symbols, chunks)
+    try:
+        return [result for chunk in results for result in chunk]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
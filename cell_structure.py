@@ -0,0 +1,155 @@
+"""
+The cell structure of the orbifold of permutation symbols, as sparse matrices in compressed sparse row (CSR) form, for
+graph algorithms in NumPy or SciPy without walking Face objects.
+
+The cells of a symbol with m edges are
+    faces: numbered by face index, as in the face code, so the boundary faces come first
+    edges: the m edges of the permutation symbol, whose edgelines 2 * edge + side are the sides of the faces
+    boundary components: in the order of PermutationSymbol.boundary_components
+and the matrices are
+    face_edge (faces x edges): the number of edgelines of the face on the edge, 0, 1 or 2
+    face_face (faces x faces): for each pair of faces, the number of edges with one edgeline in each.  An edge with
+        both edgelines in the same face adds 2 to the diagonal, so that each row sums to the number of edgelines of
+        the face on edges which have both edgelines.
+    boundary_face (boundary components x faces): 1 where the face is on the boundary component.  The boundary
+        component of a half-band has no faces.
+
+CellStructure.from_symbols builds one block-diagonal structure for many symbols: the faces, edges and boundary
+components of each symbol are numbered after those of the symbols before it, and face_offsets, edge_offsets and
+component_offsets give where each symbol starts.
+
+    >>> cells = CellStructure.from_symbols(enumerate_symbols(6))
+    >>> cells.face_face.to_scipy()
+
+The cells come from PermutationSymbol.face_labels, which numbers the faces in the same order as set_face_info, so the
+symbols are built with face_info=False.
+
+This module requires NumPy; CSRMatrix.to_scipy also requires SciPy.
+"""
+
+import numpy as np
+
+from archimedean_tilings import Location, map_symbols
+
+
+class CSRMatrix:
+    """
+        A sparse integer matrix: the entries of row r are data[indptr[r]:indptr[r + 1]], in the columns
+        indices[indptr[r]:indptr[r + 1]], which are increasing.
+    """
+    def __init__(self, shape, indptr, indices, data):
+        self.shape = shape
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    @staticmethod
+    def from_coordinates(shape, rows, columns, values=None):
+        """
+            The matrix with the sum of the values at each (row, column); values default to 1.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = np.asarray(columns, dtype=np.int64)
+        values = np.ones(len(rows), dtype=np.int32) if values is None else np.asarray(values, dtype=np.int32)
+        keys, inverse = np.unique(rows * shape[1] + columns, return_inverse=True)
+        data = np.zeros(len(keys), dtype=np.int32)
+        np.add.at(data, inverse, values)
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // shape[1], minlength=shape[0]), out=indptr[1:])
+        return CSRMatrix(shape, indptr, keys % shape[1], data)
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def row(self, r):
+        """
+            The (columns, values) of the entries in row r.
+        """
+        return self.indices[self.indptr[r]:self.indptr[r + 1]], self.data[self.indptr[r]:self.indptr[r + 1]]
+
+    def toarray(self):
+        array = np.zeros(self.shape, dtype=np.int32)
+        array[np.repeat(np.arange(self.shape[0]), np.diff(self.indptr)), self.indices] = self.data
+        return array
+
+    def to_scipy(self):
+        import scipy.sparse
+        return scipy.sparse.csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+
+def _face_labels(ps):
+    return ps.face_labels()
+
+
+class CellStructure:
+    def __init__(self, symbols, labels, boundary_components, num_faces):
+        """
+            The structure of the given symbols, from the labels, boundary_components and num_faces of each, as
+            returned by PermutationSymbol.face_labels.
+        """
+        self.symbols = list(symbols)
+        self.face_offsets = np.zeros(len(self.symbols) + 1, dtype=np.int64)
+        self.edge_offsets = np.zeros(len(self.symbols) + 1, dtype=np.int64)
+        self.component_offsets = np.zeros(len(self.symbols) + 1, dtype=np.int64)
+        np.cumsum(num_faces, out=self.face_offsets[1:])
+        np.cumsum([len(components) for components in boundary_components], out=self.component_offsets[1:])
+        num_edges = [len(symbol_labels) // 2 - 1 for symbol_labels in labels]
+        np.cumsum(num_edges, out=self.edge_offsets[1:])
+        self.num_faces = int(self.face_offsets[-1])
+        self.num_edges = int(self.edge_offsets[-1])
+        self.num_boundary_components = int(self.component_offsets[-1])
+
+        # the face of every edgeline 2 * edge + side, numbered across all the symbols, and -1 for those which do not
+        # exist; BL and BU are on no edge, so they are left out.
+        faces = np.array([label for symbol_labels in labels for label in symbol_labels[:-2]], dtype=np.int64)
+        exists = faces >= 0
+        faces += np.repeat(self.face_offsets[:-1], 2 * np.asarray(num_edges, dtype=np.int64))
+        edgelines = np.flatnonzero(exists)
+        self.face_edge = CSRMatrix.from_coordinates((self.num_faces, self.num_edges), faces[edgelines],
+                                                    edgelines >> 1)
+
+        lower, upper = faces[0::2], faces[1::2]
+        shared = exists[0::2] & exists[1::2]
+        self.face_face = CSRMatrix.from_coordinates((self.num_faces, self.num_faces),
+                                                    np.concatenate([lower[shared], upper[shared]]),
+                                                    np.concatenate([upper[shared], lower[shared]]))
+
+        components, component_faces = [], []
+        for face_offset, component_offset, symbol_components in zip(self.face_offsets, self.component_offsets,
+                                                                   boundary_components):
+            for c, component in enumerate(symbol_components):
+                components.extend([component_offset + c] * len(component))
+                component_faces.extend(face_offset + index for index in component)
+        self.boundary_face = CSRMatrix.from_coordinates((self.num_boundary_components, self.num_faces), components,
+                                                        component_faces)
+
+        self.face_location = np.full(self.num_faces, Location.INTERIOR, dtype=np.uint8)
+        self.face_location[np.asarray(component_faces, dtype=np.int64)] = Location.BOUNDARY
+
+    @staticmethod
+    def from_symbol(ps):
+        """
+            The structure of one PermutationSymbol, which may have been created with face_info=False.
+        """
+        labels, boundary_components, num_faces = ps.face_labels()
+        return CellStructure([ps.symbol_string], [labels], [boundary_components], [num_faces])
+
+    @staticmethod
+    def from_symbols(symbol_strings, workers=1, mode=None):
+        """
+            The block-diagonal structure of the given symbol strings.  With more than one worker the faces are found
+            by map_symbols.
+        """
+        symbol_strings = list(symbol_strings)
+        results = map_symbols(_face_labels, symbol_strings, workers, mode, face_info=False)
+        return CellStructure(symbol_strings, *zip(*results)) if results else CellStructure([], [], [], [])
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def symbol_of_faces(self, faces):
+        """
+            The index in self.symbols of the symbol of each of the given faces.
+        """
+        return np.searchsorted(self.face_offsets, faces, side='right') - 1
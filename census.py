@@ -0,0 +1,237 @@
+"""
+Census results: one record per permutation symbol, stored as columns of NumPy arrays, with a small query layer for
+filtering, grouping, counting and histograms which works on the arrays without building any PermutationSymbol.
+
+    >>> census = Census.build(6)
+    >>> census.save('census')
+    >>> census = Census.load('census')
+    >>> census.group_by('orbifold_type').count()
+    >>> census.group_by('num_edges').histogram('num_faces')
+    >>> census.group_by('local_symmetry').mean(~census['is_orientable'])
+    >>> census.filter(num_edges=6, crosscaps=(1, 2)).count()
+
+The columns are:
+    symbol: the symbol string
+    num_edges, local_symmetry (a Location), is_orientable, handles, crosscaps
+    num_boundary_components, num_boundary_faces, num_interior_faces, num_faces, num_rotary_arms
+    orbifold_type: Orbifold.type_string, the orbifold with every face parameter written as 'a' in a canonical form,
+        such as '(2,a,n)*(a)', so that equal orbifolds have the same type.  This is a categorical column: the array
+        holds integer codes into the list census.categories['orbifold_type'], but filters and results use the strings.
+
+This module requires NumPy.
+"""
+
+import os
+
+import numpy as np
+
+from archimedean_tilings import PermutationSymbol, Location, enumerate_symbols
+
+
+class Census:
+    # counts are int32, since a symbol may have any number of edges (see random_symbol)
+    COLUMNS = (('symbol', 'S'), ('num_edges', np.int32), ('local_symmetry', np.uint8), ('is_orientable', np.bool_),
+               ('handles', np.int32), ('crosscaps', np.int32), ('num_boundary_components', np.int32),
+               ('num_boundary_faces', np.int32), ('num_interior_faces', np.int32), ('num_faces', np.int32),
+               ('num_rotary_arms', np.int32), ('orbifold_type', np.int32))
+    CATEGORICAL = ('orbifold_type',)
+
+    def __init__(self, columns, categories):
+        self.columns = columns
+        self.categories = categories
+
+    @staticmethod
+    def from_symbols(permutation_symbols):
+        rows = dict((name, []) for name, _ in Census.COLUMNS)
+        for ps in permutation_symbols:
+            num_boundary_faces = sum(len(bc.faces) for bc in ps.boundary_components)
+            row = {'symbol': ps.symbol_string, 'num_edges': ps.num_edges, 'local_symmetry': ps.local_symmetry,
+                   'is_orientable': ps.is_orientable, 'handles': ps.orbifold.handles,
+                   'crosscaps': ps.orbifold.crosscaps, 'num_boundary_components': len(ps.boundary_components),
+                   'num_boundary_faces': num_boundary_faces, 'num_interior_faces': len(ps.interior_faces),
+                   'num_faces': ps.num_faces, 'num_rotary_arms': ps.num_rotary_arms,
+                   'orbifold_type': ps.orbifold.type_string()}
+            for name, value in row.items():
+                rows[name].append(value)
+        columns = {}
+        categories = {}
+        for name, dtype in Census.COLUMNS:
+            if name in Census.CATEGORICAL:
+                values, codes = np.unique(np.array(rows[name], dtype=str), return_inverse=True)
+                categories[name] = values.tolist()
+                columns[name] = codes.astype(dtype)
+            else:
+                columns[name] = np.array(rows[name], dtype=dtype)
+        return Census(columns, categories)
+
+    @staticmethod
+    def build(max_edges, min_edges=1):
+        """
+            The census of all valid symbols with min_edges to max_edges edges.
+        """
+        return Census.from_symbols(PermutationSymbol(symbol_string) for m in range(min_edges, max_edges + 1)
+                                   for symbol_string in enumerate_symbols(m))
+
+    def save(self, directory):
+        """
+            Save the census as one .npy file per column in the given directory, creating it if needed.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name, column in self.columns.items():
+            np.save(os.path.join(directory, name + '.npy'), column)
+        for name, values in self.categories.items():
+            np.save(os.path.join(directory, name + '_categories.npy'), np.array(values, dtype=str))
+
+    @staticmethod
+    def load(directory, mmap=True):
+        """
+            Load a census saved with save().  With mmap, the columns are memory-mapped, so only the parts which a
+            query touches are read.
+        """
+        columns = {}
+        categories = {}
+        for name, _ in Census.COLUMNS:
+            columns[name] = np.load(os.path.join(directory, name + '.npy'), mmap_mode='r' if mmap else None)
+        for name in Census.CATEGORICAL:
+            categories[name] = np.load(os.path.join(directory, name + '_categories.npy')).tolist()
+        return Census(columns, categories)
+
+    def __len__(self):
+        return len(self.columns['num_edges'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def count(self):
+        return len(self)
+
+    def decode(self, name, values):
+        """
+            The values of the given column as Python values, with categorical codes replaced by their strings.
+        """
+        if name in self.categories:
+            return [self.categories[name][v] for v in values]
+        if name == 'symbol':
+            return [v.decode() for v in values]
+        return np.asarray(values).tolist()
+
+    def mask(self, name, value):
+        """
+            The rows whose column has the given value, or one of the given values if value is a list, tuple or set.
+        """
+        column = self.columns[name]
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        if name in self.categories:
+            values = [self.categories[name].index(v) for v in values if v in self.categories[name]]
+        elif name == 'symbol':
+            values = [v.encode() for v in values]
+        if len(values) == 1:
+            return column == values[0]
+        return np.isin(column, values)
+
+    def filter(self, mask=None, **conditions):
+        """
+            The census of the rows selected by the boolean array mask (if given), and with the given values of the
+            given columns (as in mask()).
+        """
+        selected = np.ones(len(self), dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+        for name, value in conditions.items():
+            selected = selected & self.mask(name, value)
+        return Census(dict((name, column[selected]) for name, column in self.columns.items()), self.categories)
+
+    def histogram(self, name):
+        """
+            A dict from each value of the given column to the number of rows with that value.
+        """
+        return self.group_by(name).count()
+
+    def group_by(self, *names):
+        return GroupBy(self, names)
+
+
+class GroupBy:
+    """
+        The rows of a census grouped by the values of some columns.  The results of count, histogram, sum and mean
+        are dicts whose keys are the values of the columns, or tuples of them if there is more than one column.
+    """
+    MAX_DENSE_GROUPS = 1 << 24
+
+    def __init__(self, census, names):
+        self.census = census
+        self.names = names
+        # Number each group with a mixed radix number made from the codes of its values.  Small integer columns
+        # are their own codes, so no sorting is needed.
+        codes = []
+        self.values = []
+        for name in names:
+            column = census[name]
+            if column.dtype.kind in 'biu' and len(column):
+                low, high = int(column.min()), int(column.max())
+                if high - low < 1 << 16:
+                    codes.append(np.asarray(column, dtype=np.int64) - low)
+                    self.values.append(np.arange(low, high + 1).astype(column.dtype))
+                    continue
+            values, inverse = np.unique(column, return_inverse=True)
+            codes.append(inverse.reshape(-1))
+            self.values.append(values)
+        self.shape = tuple(len(v) for v in self.values)
+        num_groups = int(np.prod(self.shape)) if self.shape else 1
+        group = np.ravel_multi_index(codes, self.shape) if codes else np.zeros(len(census), dtype=np.int64)
+        if num_groups > GroupBy.MAX_DENSE_GROUPS:
+            self.groups, group = np.unique(group, return_inverse=True)
+        else:
+            self.groups = None
+        self.group = group.reshape(-1)
+        self.num_groups = num_groups if self.groups is None else len(self.groups)
+
+    def _keys(self, counts):
+        present = np.flatnonzero(counts)
+        numbers = present if self.groups is None else self.groups[present]
+        indices = np.unravel_index(numbers, self.shape)
+        decoded = [self.census.decode(name, values[index])
+                   for name, values, index in zip(self.names, self.values, indices)]
+        if len(self.names) == 1:
+            return present, decoded[0]
+        return present, list(zip(*decoded))
+
+    def _reduce(self, weights=None):
+        return np.bincount(self.group, weights=weights, minlength=self.num_groups)
+
+    def count(self):
+        counts = self._reduce()
+        present, keys = self._keys(counts)
+        return dict(zip(keys, counts[present].tolist()))
+
+    def sum(self, column):
+        """
+            The sum of a column (given by name, or as an array with one entry per row) over each group.
+        """
+        counts = self._reduce()
+        sums = self._reduce(np.asarray(self._column(column), dtype=np.float64))
+        present, keys = self._keys(counts)
+        return dict(zip(keys, sums[present].tolist()))
+
+    def mean(self, column):
+        """
+            The mean of a column (given by name, or as an array with one entry per row) over each group.  For a
+            boolean column this is the fraction of rows in which it is true.
+        """
+        counts = self._reduce()
+        sums = self._reduce(np.asarray(self._column(column), dtype=np.float64))
+        present, keys = self._keys(counts)
+        return dict(zip(keys, (sums[present] / counts[present]).tolist()))
+
+    def histogram(self, name):
+        """
+            For each group, a dict from each value of the given column to the number of rows with that value.
+        """
+        inner = GroupBy(self.census, self.names + (name,)).count()
+        histograms = {}
+        for key, count in inner.items():
+            group_key = key[0] if len(self.names) == 1 else key[:-1]
+            histograms.setdefault(group_key, {})[key[-1]] = count
+        return histograms
+
+    def _column(self, column):
+        return self.census[column] if isinstance(column, str) else column
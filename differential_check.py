@@ -0,0 +1,309 @@
+"""
+Differential check of face decomposition engines against PermutationSymbol.set_face_info.
+
+An engine is a function taking a permutation symbol string to a FaceInfo.  Every valid symbol up to a given number of
+edges (see enumerate_symbols) is run through the reference engine, which is PermutationSymbol itself, and through an
+alternate engine, in worker processes.  The results are compared after renumbering the faces in order of first
+appearance in the face code, since engines are free to number faces differently:
+    boundary_components and interior_faces: compared as sets of faces, each face being its set of edgelines
+    face_code: compared position by position
+    orbifold: compared with Orbifold.__eq__, which allows kaleidoscopes to be rotated and reflected
+Each disagreement is reported with a minimized counterexample: a smallest symbol found by removing and simplifying
+features which still shows a disagreement.
+
+    python differential_check.py 8
+    python differential_check.py 10 --processes 8 --engine mymodule:my_engine
+
+The default alternate engine is label_face_info, which uses PermutationSymbol.face_labels, the walk on integer edgeline
+numbers behind orbifold_only and the cell structure.
+"""
+
+import argparse
+import importlib
+import itertools
+import multiprocessing
+import re
+import sys
+import time
+
+from archimedean_tilings import PermutationSymbol, Orbifold, enumerate_symbols
+
+FIELDS = ('boundary_components', 'interior_faces', 'face_code', 'orbifold')
+
+
+class FaceInfo:
+    """
+        The result of an engine, in plain data:
+            boundary_components: a list of lists of faces
+            interior_faces: a list of faces
+            face_code: a sequence of pairs (number_of_sides, face index), as PermutationSymbol.face_code
+            orbifold: an Orbifold
+        where a face is a pair (face index, edgelines), and each edgeline is a pair (edge index, side) with edge index
+        None for the boundary edgelines.
+    """
+    def __init__(self, boundary_components, interior_faces, face_code, orbifold):
+        self.boundary_components = boundary_components
+        self.interior_faces = interior_faces
+        self.face_code = face_code
+        self.orbifold = orbifold
+
+
+def reference_face_info(symbol_string):
+    ps = PermutationSymbol(symbol_string, face_info=False)
+    ps.set_face_info(use_table=False)
+
+    def face(f):
+        return f.index, [(None if el.edge is None else el.edge.index, el.side) for el in f.edgelines]
+    return FaceInfo([[face(f) for f in bc.faces] for bc in ps.boundary_components],
+                    [face(f) for f in ps.interior_faces], ps.face_code, ps.orbifold)
+
+
+def label_face_info(symbol_string):
+    """
+        The decomposition from PermutationSymbol.face_labels, which walks the faces on integer edgeline numbers
+        instead of EdgeLine objects, with the face code read off the labels and the orbifold from orbifold_only.
+    """
+    ps = PermutationSymbol(symbol_string, face_info=False)
+    labels, boundary_components, num_faces = ps.face_labels()
+    m = ps.num_edges
+    bl = 2 * m
+    edgelines = [[] for _ in range(num_faces)]
+    for e, face in enumerate(labels):
+        if face >= 0:
+            edgelines[face].append((e >> 1 if e < bl else None, e & 1))
+    num_boundary_faces = sum(map(len, boundary_components))
+
+    def number_of_sides(face):
+        half_sides = sum(1 for edge, _ in edgelines[face] if edge is not None)
+        return half_sides if face < num_boundary_faces else half_sides // 2
+
+    # one entry for BL and each upper edgeline, then the reflection of the interior entries, as get_face_code
+    lower_boundary, upper_boundary = ps.has_lower_boundary_edgeline(), ps.has_upper_boundary_edgeline()
+    keys = ([bl] if lower_boundary else []) + [e for e in range(1, bl, 2) if labels[e] >= 0]
+    face_code = [(number_of_sides(labels[e]), labels[e]) for e in keys]
+    if ps.has_half_band or ps.num_half_arms == 2:
+        face_code += face_code[::-1]
+    elif lower_boundary or upper_boundary:
+        face_code += face_code[1 if lower_boundary else 0:len(face_code) - (1 if upper_boundary else 0)][::-1]
+    if lower_boundary:
+        face_code = face_code[1:] + face_code[:1]
+
+    def face_pair(f):
+        return f, edgelines[f]
+    return FaceInfo([[face_pair(f) for f in component] for component in boundary_components],
+                    [face_pair(f) for f in range(num_boundary_faces, num_faces)], face_code, ps.orbifold_only())
+
+
+def normalize(info):
+    """
+        Renumber the faces of a FaceInfo in order of first appearance in the face code.  Return a dict from field
+        name to a value which can be compared with ==.
+    """
+    renaming = {}
+    for sides, index in info.face_code:
+        renaming.setdefault(index, len(renaming))
+
+    def face(index, edgelines):
+        return renaming.get(index, -1), tuple(sorted((-1 if edge is None else edge, side) for edge, side in edgelines))
+
+    def parameter(x):
+        return '[%d]' % renaming.get(int(x[1:-1]), -1) if isinstance(x, str) and x.startswith('[') else x
+    orbifold = info.orbifold
+    return {'boundary_components': sorted(sorted(face(*f) for f in bc) for bc in info.boundary_components),
+            'interior_faces': sorted(face(*f) for f in info.interior_faces),
+            'face_code': [(sides, renaming[index]) for sides, index in info.face_code],
+            'orbifold': Orbifold([parameter(x) for x in orbifold.gyrations],
+                                 [[parameter(x) for x in k] for k in orbifold.kaleidoscopes],
+                                 orbifold.handles, orbifold.crosscaps)}
+
+
+def resolve_engine(engine):
+    """
+        An engine may be given as a function, or as a string 'module:function'.
+    """
+    if callable(engine):
+        return engine
+    module, function = engine.split(':')
+    return getattr(importlib.import_module(module), function)
+
+
+def disagreements(symbol_string, reference, alternate, seconds=None):
+    """
+        The list of fields in which the two engines disagree on the given symbol.  An engine which raises an
+        exception disagrees in a field named after the exception, unless both raise the same type of exception.
+        If seconds is given, the time spent in each engine is added to it.
+    """
+    results = []
+    for k, engine in enumerate((reference, alternate)):
+        start = time.time()
+        try:
+            info = engine(symbol_string)
+        except Exception as e:
+            info = '%s: %s' % (type(e).__name__, e)
+        if seconds is not None:
+            seconds[k] += time.time() - start
+        results.append(info if isinstance(info, str) else normalize(info))
+    if isinstance(results[0], str) or isinstance(results[1], str):
+        if isinstance(results[0], str) and isinstance(results[1], str) and \
+                results[0].split(':')[0] == results[1].split(':')[0]:
+            return []
+        return ['error (%s / %s)' % tuple(r if isinstance(r, str) else 'ok' for r in results)]
+    return [field for field in FIELDS if results[0][field] != results[1][field]]
+
+
+_FEATURE_RE = re.compile('([(\\[<]) *([0-9]+) *(?:, *([0-9]+) *)?[)\\]>]')
+
+
+def _parse_features(symbol_string):
+    return [(bracket, int(i), int(j) if j else None) for bracket, i, j in _FEATURE_RE.findall(symbol_string)], \
+        symbol_string[-1]
+
+
+def _format_features(features, suffix):
+    # renumber the edges 0, 1, ..., keeping their order
+    edges = sorted(set(x for _, i, j in features for x in (i, j) if x is not None))
+    number = dict((edge, k) for k, edge in enumerate(edges))
+    closing = {'(': ')', '[': ']', '<': '>'}
+    return ''.join(bracket + ('%d' % number[i] if j is None else '%d,%d' % (number[i], number[j])) + closing[bracket]
+                   for bracket, i, j in features) + suffix
+
+
+def _smaller_symbols(symbol_string):
+    # symbols made by removing one feature, or by replacing one feature with a simpler one
+    features, suffix = _parse_features(symbol_string)
+    for k in range(len(features)):
+        if len(features) > 1:
+            yield _format_features(features[:k] + features[k + 1:], suffix)
+    for k, (bracket, i, j) in enumerate(features):
+        if j is not None and bracket != '<':
+            yield _format_features(features[:k] + [(bracket, i, None), (bracket, j, None)] + features[k + 1:],
+                                   suffix)
+        if bracket == '[':
+            yield _format_features(features[:k] + [('(', i, j)] + features[k + 1:], suffix)
+    if suffix == '*' and not any(bracket == '<' for bracket, _, _ in features):
+        yield _format_features(features, '.')
+
+
+def _is_valid(symbol_string):
+    try:
+        PermutationSymbol(symbol_string)
+    except ValueError:
+        return False
+    except Exception:
+        pass  # the reference fails on a valid symbol, which is itself worth reporting
+    return True
+
+
+def minimize(symbol_string, reference, alternate):
+    """
+        Greedily shrink a symbol on which the engines disagree, as long as the smaller symbol is valid and the
+        engines still disagree on it.
+    """
+    reference, alternate = resolve_engine(reference), resolve_engine(alternate)
+    shrunk = True
+    while shrunk:
+        shrunk = False
+        for smaller in _smaller_symbols(symbol_string):
+            if _is_valid(smaller) and disagreements(smaller, reference, alternate):
+                symbol_string = smaller
+                shrunk = True
+                break
+    return symbol_string
+
+
+def check_symbols(symbol_strings, reference, alternate):
+    """
+        Run both engines on the given symbols.  Return (number of symbols, list of (symbol, fields) for the
+        disagreements, seconds in the reference engine, seconds in the alternate engine).
+    """
+    reference, alternate = resolve_engine(reference), resolve_engine(alternate)
+    failures = []
+    seconds = [0.0, 0.0]
+    for symbol_string in symbol_strings:
+        fields = disagreements(symbol_string, reference, alternate, seconds)
+        if fields:
+            failures.append((symbol_string, fields))
+    return len(symbol_strings), failures, seconds[0], seconds[1]
+
+
+def _check_chunk(arguments):
+    return check_symbols(*arguments)
+
+
+class Report:
+    def __init__(self):
+        self.num_symbols = 0
+        self.failures = []
+        self.reference_seconds = 0.0
+        self.alternate_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.counterexamples = []
+
+    def write(self, f=sys.stdout):
+        f.write('%d symbols in %.1f s (%.0f symbols/s)\n' % (self.num_symbols, self.wall_seconds,
+                                                            self.num_symbols / max(self.wall_seconds, 1e-9)))
+        f.write('reference engine: %.1f us/symbol, alternate engine: %.1f us/symbol\n' %
+                (1e6 * self.reference_seconds / max(self.num_symbols, 1),
+                 1e6 * self.alternate_seconds / max(self.num_symbols, 1)))
+        f.write('%d disagreements\n' % len(self.failures))
+        for symbol_string, fields in self.failures[:20]:
+            f.write('    %s: %s\n' % (symbol_string, ', '.join(fields)))
+        for symbol_string, fields in self.counterexamples:
+            f.write('minimized counterexample: %s: %s\n' % (symbol_string, ', '.join(fields)))
+
+
+def run(max_edges, min_edges=1, reference=reference_face_info, alternate=label_face_info, processes=None,
+        chunk_size=2000, max_counterexamples=5):
+    """
+        Check every valid symbol with min_edges to max_edges edges.  With processes=1 everything runs in this
+        process; otherwise the symbols are checked in chunks by a pool of worker processes, and the engines must be
+        given as importable functions or 'module:function' strings.  Return a Report.
+    """
+    report = Report()
+    start = time.time()
+    symbols = itertools.chain.from_iterable(enumerate_symbols(m) for m in range(min_edges, max_edges + 1))
+    chunks = iter(lambda: list(itertools.islice(symbols, chunk_size)), [])
+    arguments = ((chunk, reference, alternate) for chunk in chunks)
+    if processes == 1:
+        results = map(_check_chunk, arguments)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_check_chunk, arguments)
+    try:
+        for num_symbols, failures, reference_seconds, alternate_seconds in results:
+            report.num_symbols += num_symbols
+            report.failures.extend(failures)
+            report.reference_seconds += reference_seconds
+            report.alternate_seconds += alternate_seconds
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    report.wall_seconds = time.time() - start
+
+    counterexamples = set()
+    for symbol_string, _ in sorted(report.failures, key=lambda failure: len(failure[0])):
+        if len(counterexamples) >= max_counterexamples:
+            break
+        counterexamples.add(minimize(symbol_string, reference, alternate))
+    reference, alternate = resolve_engine(reference), resolve_engine(alternate)
+    report.counterexamples = [(symbol_string, disagreements(symbol_string, reference, alternate))
+                              for symbol_string in sorted(counterexamples, key=lambda s: (len(s), s))]
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare a face decomposition engine with set_face_info on every '
+                                                 'valid permutation symbol up to a number of edges.')
+    parser.add_argument('max_edges', type=int)
+    parser.add_argument('--min-edges', type=int, default=1)
+    parser.add_argument('--processes', type=int, default=None, help='default: one per CPU')
+    parser.add_argument('--engine', default='differential_check:label_face_info',
+                        help='the alternate engine, as module:function')
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    args = parser.parse_args()
+    report = run(args.max_edges, args.min_edges, 'differential_check:reference_face_info', args.engine,
+                 args.processes, args.chunk_size)
+    report.write()
+    sys.exit(1 if report.failures else 0)
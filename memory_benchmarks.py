@@ -0,0 +1,226 @@
+"""
+Allocation and peak-memory regression harness for PermutationSymbol.
+
+Each symbol is built under tracemalloc, and we record
+    peak: the largest amount of memory allocated at once while the symbol is built,
+    retained: the memory still allocated while the finished symbol is alive,
+    blocks: the number of memory blocks behind the retained memory, roughly the number of objects in the symbol.
+tracemalloc only keeps the blocks which are still allocated, so blocks counts the allocations which the symbol holds on
+to, not every allocation made while building it.
+
+The symbols are the synthetic families below at increasing numbers of edges, and the entries of test_cases.txt, whose
+budget is the largest measurement over all of them.  The budgets are kept in memory_budgets.txt.
+
+Each symbol is measured in a fresh Python process: how much memory an object takes depends on what the process built
+before (for example, CPython stops sharing the attribute names of instances after a few dozen instances), so measuring
+in the running process would measure the order of the tests rather than the code.  The faces are always computed,
+even when a symbol table is installed (see use_symbol_table), so the budgets measure the face walk.
+
+    python memory_benchmarks.py             measure, and fail if a measurement exceeds its budget by more than TOLERANCE
+    python memory_benchmarks.py --update    measure, and write the measurements to memory_budgets.txt as the budgets
+
+The sizes of Python objects change between Python versions, so the budgets should be updated with the interpreter.
+"""
+
+import gc
+import os
+import platform
+import subprocess
+import sys
+import tracemalloc
+
+from archimedean_tilings import PermutationSymbol
+
+SYNTHETIC_FAMILIES = {
+    'rotary_arms': lambda m: ''.join('(%d)' % i for i in range(m)) + '.',
+    'untwisted_bands': lambda m: ''.join('(%d,%d)' % (i, i + 1) for i in range(0, m, 2)) + '.',
+    'twisted_bands': lambda m: ''.join('[%d,%d]' % (i, i + 1) for i in range(0, m, 2)) + '.',
+    'nested_bands': lambda m: ''.join('(%d,%d)' % (i, m - 1 - i) for i in range(m // 2)) + '.',
+    'folded_bands': lambda m: ''.join('[%d]' % i for i in range(m)) + '*',
+    'half_arms': lambda m: '<0>' + ''.join('[%d]' % i for i in range(1, m - 1)) + '<%d>*' % (m - 1),
+    'half_band': lambda m: '<0,%d>' % (m - 1) + ''.join('(%d)' % i for i in range(1, m - 1)) + '*',
+}
+EDGE_COUNTS = (4, 16, 64, 256)
+TEST_CASES_FAMILY = 'test_cases'
+TOLERANCE = 0.1
+WARM_UP_BUILDS = 50
+WARM_UP_SYMBOL = '<0>[1](2)(3,4)*'  # with a boundary component and an interior face
+
+_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+BUDGETS_FILE = os.path.join(_DIRECTORY, 'memory_budgets.txt')
+TEST_CASES_FILE = os.path.join(_DIRECTORY, 'test_cases.txt')
+
+
+class MemoryUsage:
+    FIELDS = ('peak', 'retained', 'blocks')
+
+    def __init__(self, peak, retained, blocks):
+        self.peak = peak
+        self.retained = retained
+        self.blocks = blocks
+
+    def __eq__(self, other):
+        return (self.peak, self.retained, self.blocks) == (other.peak, other.retained, other.blocks)
+
+    def __repr__(self):
+        return 'peak %d, retained %d, blocks %d' % (self.peak, self.retained, self.blocks)
+
+    @staticmethod
+    def maximum(usages):
+        return MemoryUsage(*[max(getattr(u, field) for u in usages) for field in MemoryUsage.FIELDS])
+
+    def exceeded(self, budget, tolerance=TOLERANCE):
+        """
+            The fields in which this usage is more than the budget allows.
+        """
+        return [field for field in MemoryUsage.FIELDS
+                if getattr(self, field) > getattr(budget, field) * (1 + tolerance)]
+
+
+def measure(symbol_string, isolated=True):
+    """
+        The MemoryUsage of building the PermutationSymbol with the given string, in a fresh Python process, or in
+        this one if isolated is False.
+    """
+    if not isolated:
+        return _measure_here(symbol_string)
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--measure', symbol_string])
+    return MemoryUsage(*[int(x) for x in output.split()])
+
+
+def _build(symbol_string):
+    ps = PermutationSymbol(symbol_string, face_info=False)
+    ps.set_face_info(use_table=False)
+    return ps
+
+
+def _measure_here(symbol_string):
+    # Build symbols first, so that one-time costs are not counted: compiling the regular expressions, and CPython
+    # settling the size of the instance dictionaries, which starts large in a new process.
+    for _ in range(WARM_UP_BUILDS):
+        _build(WARM_UP_SYMBOL)
+    _build(symbol_string)
+    gc.collect()
+    was_tracing = tracemalloc.is_tracing()
+    if was_tracing:
+        tracemalloc.stop()
+    tracemalloc.start()
+    try:
+        ps = _build(symbol_string)
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    finally:
+        tracemalloc.stop()
+        if was_tracing:
+            tracemalloc.start()
+    del ps
+    return MemoryUsage(peak, retained, blocks)
+
+
+def test_case_symbols(filename=TEST_CASES_FILE):
+    symbols = []
+    with open(filename) as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            if line:
+                symbols.append(line.split()[0])
+    return symbols
+
+
+def measure_all(edge_counts=EDGE_COUNTS, test_cases=True):
+    """
+        Measure every synthetic family at the given numbers of edges, and the entries of test_cases.txt.  Return a
+        dict taking (family, edges) to MemoryUsage, where edges is None for the test cases.
+    """
+    usages = {}
+    for family in sorted(SYNTHETIC_FAMILIES):
+        for m in edge_counts:
+            usages[(family, m)] = measure(SYNTHETIC_FAMILIES[family](m))
+    if test_cases:
+        usages[(TEST_CASES_FAMILY, None)] = MemoryUsage.maximum([measure(s) for s in test_case_symbols()])
+    return usages
+
+
+def read_budgets(filename=BUDGETS_FILE):
+    budgets = {}
+    with open(filename) as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            family, edges, peak, retained, blocks = line.split()
+            budgets[(family, None if edges == '-' else int(edges))] = MemoryUsage(int(peak), int(retained),
+                                                                                   int(blocks))
+    return budgets
+
+
+def budgets_python_version(filename=BUDGETS_FILE):
+    """
+        The major and minor version of the Python which recorded the budgets, like '3.11'.
+    """
+    with open(filename) as f:
+        header = f.readline()
+    return '.'.join(header.split('Python ')[1].split('.')[:2])
+
+
+def write_budgets(usages, filename=BUDGETS_FILE):
+    with open(filename, 'w') as f:
+        f.write('# Memory budgets for memory_benchmarks.py, recorded with Python %s.\n' % platform.python_version())
+        f.write('# %-18s %6s %10s %10s %8s\n' % ('family', 'edges', 'peak', 'retained', 'blocks'))
+        for family, edges in sorted(usages, key=lambda key: (key[0], key[1] or 0)):
+            usage = usages[(family, edges)]
+            f.write('%-20s %6s %10d %10d %8d\n' % (family, '-' if edges is None else edges, usage.peak,
+                                                   usage.retained, usage.blocks))
+
+
+def check(usages, budgets, tolerance=TOLERANCE):
+    """
+        Return a list of (family, edges, fields) for the measurements which exceed their budgets.  A measurement with
+        no budget is an error too, so that new families get budgets.
+    """
+    failures = []
+    for key in sorted(usages, key=lambda key: (key[0], key[1] or 0)):
+        if key not in budgets:
+            failures.append(key + (['no budget'],))
+            continue
+        exceeded = usages[key].exceeded(budgets[key], tolerance)
+        if exceeded:
+            failures.append(key + (exceeded,))
+    return failures
+
+
+def report(usages, budgets, f=sys.stdout):
+    f.write('%-20s %6s %10s %10s %8s %10s %8s\n' % ('family', 'edges', 'peak', 'retained', 'blocks', 'bytes/edge',
+                                                     'budget'))
+    for family, edges in sorted(usages, key=lambda key: (key[0], key[1] or 0)):
+        usage = usages[(family, edges)]
+        budget = budgets.get((family, edges))
+        if budget is None:
+            status = 'none'
+        elif usage.exceeded(budget):
+            status = 'OVER'
+        else:
+            status = '%d%%' % round(100.0 * usage.peak / budget.peak)
+        f.write('%-20s %6s %10d %10d %8d %10s %8s\n' % (family, '-' if edges is None else edges, usage.peak,
+                                                        usage.retained, usage.blocks,
+                                                        '-' if edges is None else usage.retained // edges, status))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        usage = _measure_here(sys.argv[2])
+        sys.stdout.write('%d %d %d\n' % (usage.peak, usage.retained, usage.blocks))
+        sys.exit(0)
+    usages = measure_all()
+    if '--update' in sys.argv[1:]:
+        write_budgets(usages)
+        report(usages, read_budgets())
+    else:
+        budgets = read_budgets()
+        report(usages, budgets)
+        failures = check(usages, budgets)
+        for family, edges, fields in failures:
+            sys.stdout.write('%s with %s edges is over budget: %s\n' % (family, '-' if edges is None else edges,
+                                                                        ', '.join(fields)))
+        sys.exit(1 if failures else 0)
@@ -0,0 +1,176 @@
+"""
+Monte Carlo estimates of statistics of permutation symbols with a given number of edges, for numbers of edges where
+enumerating every symbol is out of reach.
+
+Symbols are drawn uniformly at random from enumerate_symbols(num_edges) with random_symbol, in batches.  Batch b of a
+run with seed s uses its own random.Random seeded from (s, num_edges, b), and the batch totals are integers, so the
+estimates depend only on the seed, the number of samples and the batch size, not on the number of processes.
+
+For each statistic in STATISTICS we estimate its mean, and for each orbifold type (the orbifold with every face
+parameter written as 'a', Orbifold.type_string) the fraction of symbols with that type, each with a confidence interval:
+the normal interval for means, and the Wilson score interval for fractions.
+
+    python monte_carlo.py 20 --samples 100000 --seed 1
+    python monte_carlo.py 30 --samples 20000 --processes 4 --batch-size 500
+"""
+
+import argparse
+import collections
+import math
+import multiprocessing
+import random
+import statistics
+import sys
+import time
+
+from archimedean_tilings import PermutationSymbol, count_symbols, random_symbol
+
+STATISTICS = collections.OrderedDict([
+    ('num_faces', lambda ps: ps.num_faces),
+    ('num_interior_faces', lambda ps: len(ps.interior_faces)),
+    ('num_boundary_faces', lambda ps: sum(len(bc.faces) for bc in ps.boundary_components)),
+    ('num_boundary_components', lambda ps: len(ps.boundary_components)),
+    ('num_rotary_arms', lambda ps: ps.num_rotary_arms),
+    ('is_orientable', lambda ps: int(ps.is_orientable)),
+    ('handles', lambda ps: ps.orbifold.handles),
+    ('crosscaps', lambda ps: ps.orbifold.crosscaps),
+])
+
+
+class BatchTotals:
+    """
+        The number of samples, and for each statistic the sum of its values and of their squares, and the number of
+        samples of each orbifold type.
+    """
+    def __init__(self):
+        self.num_samples = 0
+        self.sums = dict((name, 0) for name in STATISTICS)
+        self.squares = dict((name, 0) for name in STATISTICS)
+        self.orbifold_types = collections.Counter()
+
+    def add_symbol(self, ps):
+        self.num_samples += 1
+        for name, statistic in STATISTICS.items():
+            value = statistic(ps)
+            self.sums[name] += value
+            self.squares[name] += value * value
+        self.orbifold_types[ps.orbifold.type_string()] += 1
+
+    def add(self, other):
+        self.num_samples += other.num_samples
+        for name in STATISTICS:
+            self.sums[name] += other.sums[name]
+            self.squares[name] += other.squares[name]
+        self.orbifold_types.update(other.orbifold_types)
+
+
+def sample_batch(num_edges, seed, batch, batch_size):
+    """
+        The BatchTotals of batch number batch of a run with the given seed.
+    """
+    rng = random.Random('%s:%d:%d' % (seed, num_edges, batch))
+    totals = BatchTotals()
+    for _ in range(batch_size):
+        totals.add_symbol(PermutationSymbol(random_symbol(num_edges, rng)))
+    return totals
+
+
+def _sample_batch(arguments):
+    return sample_batch(*arguments)
+
+
+class Estimate:
+    def __init__(self, value, low, high):
+        self.value = value
+        self.low = low
+        self.high = high
+
+    def __contains__(self, x):
+        return self.low <= x <= self.high
+
+    def __repr__(self):
+        return '%.4f [%.4f, %.4f]' % (self.value, self.low, self.high)
+
+    @staticmethod
+    def mean(total, square_total, n, z):
+        mean = total / n
+        variance = max(square_total - n * mean * mean, 0) / (n - 1) if n > 1 else 0.0
+        half_width = z * math.sqrt(variance / n)
+        return Estimate(mean, mean - half_width, mean + half_width)
+
+    @staticmethod
+    def fraction(count, n, z):
+        # the Wilson score interval, which stays inside [0, 1] and is sensible for rare orbifold types
+        p = count / n
+        center = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half_width = z / (1 + z * z / n) * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+        return Estimate(p, max(center - half_width, 0.0), min(center + half_width, 1.0))
+
+
+class Report:
+    def __init__(self, num_edges, totals, confidence):
+        self.num_edges = num_edges
+        self.num_symbols = count_symbols(num_edges)
+        self.num_samples = n = totals.num_samples
+        self.confidence = confidence
+        z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.means = collections.OrderedDict((name, Estimate.mean(totals.sums[name], totals.squares[name], n, z))
+                                             for name in STATISTICS)
+        self.orbifold_types = collections.OrderedDict(
+            (name, Estimate.fraction(count, n, z)) for name, count in totals.orbifold_types.most_common())
+        self.wall_seconds = 0.0
+
+    def write(self, f=sys.stdout, max_orbifold_types=20):
+        f.write('%d samples of the %d symbols with %d edges in %.1f s (%.0f symbols/s)\n' %
+                (self.num_samples, self.num_symbols, self.num_edges, self.wall_seconds,
+                 self.num_samples / max(self.wall_seconds, 1e-9)))
+        f.write('means, with %g%% confidence intervals:\n' % (100 * self.confidence))
+        for name, estimate in self.means.items():
+            f.write('    %-24s %r\n' % (name, estimate))
+        f.write('%d orbifold types seen; fractions, with %g%% confidence intervals:\n' %
+                (len(self.orbifold_types), 100 * self.confidence))
+        for name, estimate in list(self.orbifold_types.items())[:max_orbifold_types]:
+            f.write('    %-24s %r\n' % (name, estimate))
+
+
+def run(num_edges, num_samples, seed=0, batch_size=1000, processes=None, confidence=0.95):
+    """
+        Estimate the statistics from num_samples random symbols with num_edges edges.  With processes=1 everything
+        runs in this process; otherwise the batches are sampled by a pool of worker processes.  Return a Report.
+    """
+    if num_samples < 1:
+        raise ValueError('At least one sample is needed')
+    start = time.time()
+    num_batches = (num_samples + batch_size - 1) // batch_size
+    arguments = ((num_edges, seed, batch, min(batch_size, num_samples - batch * batch_size))
+                 for batch in range(num_batches))
+    if processes == 1:
+        results = map(_sample_batch, arguments)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_sample_batch, arguments)
+    totals = BatchTotals()
+    try:
+        for batch_totals in results:
+            totals.add(batch_totals)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    report = Report(num_edges, totals, confidence)
+    report.wall_seconds = time.time() - start
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Estimate statistics of uniformly random permutation symbols with '
+                                                 'a given number of edges.')
+    parser.add_argument('num_edges', type=int)
+    parser.add_argument('--samples', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=None, help='default: one per CPU')
+    parser.add_argument('--confidence', type=float, default=0.95)
+    args = parser.parse_args()
+    run(args.num_edges, args.samples, args.seed, args.batch_size, args.processes, args.confidence).write()
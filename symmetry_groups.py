@@ -0,0 +1,220 @@
+"""
+The symmetry groups of the tilings described by permutation symbols, as groups of 3 x 3 matrices.
+
+All three geometries use the same model of the plane: a point is a vector (x, y, w), the origin is (0, 0, 1), and
+rotations about the origin act on (x, y) as usual.
+    Euclidean: points (x, y, 1), and isometries are affine maps.
+    Hyperbolic: points on the hyperboloid x^2 + y^2 - w^2 = -1, and isometries are Lorentz transformations.
+    Spherical: points on the unit sphere, and isometries are orthogonal matrices.
+
+This module requires NumPy.
+"""
+
+import math
+
+import numpy as np
+
+from archimedean_tilings import DoilyFeature, Location
+from tiling_patches import Geometry, VertexStar
+
+
+def rotation(angle):
+    c, s = math.cos(angle), math.sin(angle)
+    return np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+
+
+def reflection(angle):
+    """
+        Reflection in the line through the origin at the given angle.
+    """
+    return rotation(2 * angle).dot(np.diag([1.0, -1.0, 1.0]))
+
+
+def translation(distance, geometry):
+    """
+        Translation by the given distance along the x axis.
+    """
+    if geometry == Geometry.EUCLIDEAN:
+        return np.array([[1.0, 0.0, distance], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    elif geometry == Geometry.HYPERBOLIC:
+        c, s = math.cosh(distance), math.sinh(distance)
+        return np.array([[c, 0.0, s], [0.0, 1.0, 0.0], [s, 0.0, c]])
+    c, s = math.cos(distance), math.sin(distance)
+    return np.array([[c, 0.0, s], [0.0, 1.0, 0.0], [-s, 0.0, c]])
+
+
+def distance_from_origin(points, geometry):
+    """
+        The distance from the origin of each of the given points (an array of shape (..., 3)).
+    """
+    if geometry == Geometry.EUCLIDEAN:
+        return np.hypot(points[..., 0], points[..., 1])
+    elif geometry == Geometry.HYPERBOLIC:
+        return np.arccosh(np.maximum(points[..., 2], 1.0))
+    return np.arccos(np.clip(points[..., 2], -1.0, 1.0))
+
+
+class IsometryKind(object):
+    ROTATION = 0
+    TRANSLATION = 1
+    REFLECTION = 2
+    GLIDE_REFLECTION = 3  # a rotatory reflection on the sphere
+
+
+def isometry_kind(matrix):
+    if np.linalg.det(matrix) > 0:
+        # In all three geometries, an isometry which preserves orientation is a rotation exactly when it fixes a
+        # point, and then its trace is 1 + 2 cos(angle) < 3.
+        if np.trace(matrix) < 3 - 1e-9:
+            return IsometryKind.ROTATION
+        return IsometryKind.TRANSLATION
+    if np.allclose(matrix.dot(matrix), np.eye(3), atol=1e-9):
+        return IsometryKind.REFLECTION
+    return IsometryKind.GLIDE_REFLECTION
+
+
+class Generator:
+    def __init__(self, name, matrix):
+        self.name = name
+        self.matrix = matrix
+        self.kind = isometry_kind(matrix)
+
+    def __repr__(self):
+        kinds = ['rotation', 'translation', 'reflection', 'glide reflection']
+        return '%s: %s' % (self.name, kinds[self.kind])
+
+
+class SymmetryGroup:
+    """
+        The symmetry group of the tiling with the given permutation symbol and parameters (as in
+        tiling_patches.VertexStar), placed with a vertex at the origin and edge 0 along the x axis.
+
+        The generators are the symmetries of the vertex star, named 'n' (the rotation by 2 pi / n) and '*n' (a
+        mirror, if the local symmetry is *), together with one symmetry for each feature of the permutation symbol,
+        named by the feature, which takes the vertex to its neighbor along that edge.  The kinds of these symmetries
+        correspond to the orbifold: a rotary arm (i) gives a half turn, the 2 among the gyrations; a folded band [i]
+        gives a reflection in a mirror of the kaleidoscopes; a twisted band [i,j] gives a glide reflection, which
+        makes the orbifold non-orientable; and an untwisted band (i,j) gives a rotation or a translation.
+    """
+    DECIMALS = 6
+
+    def __init__(self, permutation_symbol, parameters):
+        self.permutation_symbol = permutation_symbol
+        self.orbifold = permutation_symbol.orbifold
+        self.star = star = VertexStar(permutation_symbol, parameters)
+        self.geometry = star.geometry
+
+        generators = [Generator('n', rotation(2 * math.pi / parameters['n']))]
+        if permutation_symbol.local_symmetry == Location.BOUNDARY:
+            # the mirror after edge m-1, which lies along edge m-1 if it is a half arm or half band
+            last = permutation_symbol.num_edges - 1
+            mirror = star.angles[last]
+            if permutation_symbol.edges[last].feature not in (DoilyFeature.HALF_ARM, DoilyFeature.HALF_BAND):
+                mirror += star.interior_angles[last] / 2
+            generators.append(Generator('*n', reflection(mirror)))
+
+        feature_strings = {DoilyFeature.ROTARY_ARM: '(%d)', DoilyFeature.FOLDED_BAND: '[%d]',
+                           DoilyFeature.HALF_ARM: '<%d>', DoilyFeature.UNTWISTED_BAND: '(%d,%d)',
+                           DoilyFeature.TWISTED_BAND: '[%d,%d]', DoilyFeature.HALF_BAND: '<%d,%d>'}
+        for edge in permutation_symbol.edges:
+            if edge.endpoint is not None and edge.endpoint < edge.index:
+                continue  # a band is one feature with two edges
+            name = feature_strings[edge.feature] % ((edge.index,) if edge.endpoint is None else
+                                                    (edge.index, edge.endpoint))
+            generators.append(Generator(name, self.neighbor_symmetry(edge.index)))
+        self.generators = generators
+
+    def neighbor_symmetry(self, slot):
+        """
+            The symmetry which takes the vertex at the origin to its neighbor across the given slot of the star.
+            It takes the partner slot (see VertexStar) to the edge pointing back at the origin.
+        """
+        star = self.star
+        partner = star.partner_slots[slot]
+        reflected = star.chiralities[slot] * star.flips[slot] * star.chiralities[partner] < 0
+        matrix = rotation(star.angles[slot]).dot(translation(star.edge_length, self.geometry)).dot(rotation(math.pi))
+        if reflected:
+            matrix = matrix.dot(np.diag([1.0, -1.0, 1.0]))
+        return matrix.dot(rotation(-star.angles[partner]))
+
+    def element_keys(self, elements):
+        """
+            Hash each matrix by its entries rounded to DECIMALS places.  Two copies of the same element differ only
+            by rounding error, but could still round differently at a rounding boundary, so we use two grids offset
+            by half a unit: copies agree in at least one of them unless both grids split them.
+
+            In the hyperbolic plane the entries grow like cosh of the distance moved, and so do their rounding errors,
+            so there the entries are first divided by the bottom right entry, which is that cosh.
+        """
+        scaled = elements.reshape(len(elements), 9) * 10.0 ** SymmetryGroup.DECIMALS
+        if self.geometry == Geometry.HYPERBOLIC:
+            scaled /= elements[:, 2, 2][:, None]
+        keys = []
+        for offset in (0.0, 0.5):
+            rounded = np.floor(scaled + offset).astype(np.int64)
+            key = np.zeros(len(elements), dtype=np.int64)
+            for i in range(9):
+                # FNV-style mixing; int64 arithmetic wraps around, as a hash should
+                key = (key ^ rounded[:, i]) * np.int64(0x100000001B3)
+                key ^= key >> 29
+            keys.append(key)
+        return keys
+
+    def elements(self, max_length=None, radius=None, max_elements=None):
+        """
+            Enumerate group elements breadth-first by word length in the generators and their inverses.  Return
+            (elements, lengths), where elements has shape (K, 3, 3) and lengths gives the length of the shortest
+            word found for each element.
+
+            At least one bound must be given.  With a radius, only words all of whose prefixes move the origin at
+            most that far are followed.
+        """
+        if max_length is None and radius is None and max_elements is None:
+            raise ValueError('One of max_length, radius or max_elements must be given')
+        step = [g.matrix for g in self.generators]
+        step += [np.linalg.inv(m) for m in step if not np.allclose(m.dot(m), np.eye(3), atol=1e-9)]
+        step = np.array(step)
+        max_elements = max_elements if max_elements is not None else np.inf
+
+        layers = [np.eye(3)[None, :, :]]
+        layer_keys = [self.element_keys(layers[0])]
+        num_elements = 1
+        length = 0
+        # As in a breadth-first search of a graph, the products of layer k with a generator lie in layers k - 1,
+        # k or k + 1, so we only compare new elements with the last two layers.
+        while len(layers[-1]) and num_elements < max_elements and (max_length is None or length < max_length):
+            candidates = np.matmul(layers[-1][:, None, :, :], step[None, :, :, :]).reshape(-1, 3, 3)
+            if radius is not None:
+                inside = distance_from_origin(candidates[:, :, 2], self.geometry) <= radius + 1e-9
+                candidates = candidates[inside]
+            keys = self.element_keys(candidates)
+            known = np.zeros(len(candidates), dtype=bool)
+            for grid in range(2):
+                window = np.concatenate([k[grid] for k in layer_keys[-2:]])
+                known |= np.isin(keys[grid], window)
+            candidates = candidates[~known]
+            keys = [k[~known] for k in keys]
+            for grid in range(2):
+                _, first = np.unique(keys[grid], return_index=True)
+                first = np.sort(first)
+                candidates = candidates[first]
+                keys = [k[first] for k in keys]
+            if len(candidates) > max_elements - num_elements:
+                candidates = candidates[:int(max_elements - num_elements)]
+                keys = [k[:len(candidates)] for k in keys]
+            layers.append(candidates)
+            layer_keys.append(keys)
+            num_elements += len(candidates)
+            length += 1
+
+        lengths = np.concatenate([np.full(len(layer), k, dtype=np.int64) for k, layer in enumerate(layers)])
+        return np.concatenate(layers), lengths
+
+    @staticmethod
+    def orbit(elements, points, batch_size=100000):
+        """
+            Apply each element to each of the given points (an array of shape (P, 3)), batch_size elements at a time.
+            Generate arrays of shape (batch, P, 3).
+        """
+        for first in range(0, len(elements), batch_size):
+            yield np.einsum('kij,pj->kpi', elements[first:first + batch_size], points)
@@ -1,6 +1,43 @@
 import unittest
 import re
-from archimedean_tilings import PermutationSymbol, Orbifold
+import collections
+import os
+import io
+import platform
+import shutil
+import tempfile
+import random
+import threading
+import warnings
+from archimedean_tilings import PermutationSymbol, Orbifold, Location, EdgeLine, EdgeLineSide, parse_face_code, \
+    normalize_face_code, find_symbols_by_face_code, enumerate_symbols, build_symbol_table, use_symbol_table, \
+    count_symbols, unrank_symbol, random_symbol, map_symbols, enumerate_face_codes, orbifolds_only
+import archimedean_tilings
+import memory_benchmarks
+import differential_check
+import monte_carlo
+
+try:
+    import numpy
+    from tiling_patches import EuclideanPatch, HyperbolicPatch, Geometry, write_arrays, read_arrays
+    from symmetry_groups import SymmetryGroup, IsometryKind
+    from census import Census
+    from cell_structure import CellStructure
+except ImportError:  # the geometric realizations need NumPy
+    numpy = None
+
+_installed_symbol_table = None
+
+
+def setUpModule():
+    # the tests compute the faces, whatever symbol table is installed; TestSymbolTable installs its own
+    global _installed_symbol_table
+    _installed_symbol_table = archimedean_tilings._symbol_table
+    use_symbol_table(None)
+
+
+def tearDownModule():
+    archimedean_tilings._symbol_table = _installed_symbol_table
 
 
 class TestBadPermutationSymbols(unittest.TestCase):
@@ -57,11 +94,11 @@ class TestKaleidoscopeEquality(unittest.TestCase):
 class TestOrbifoldNormalization(unittest.TestCase):
     def test_gyration_normalization(self):
         o1 = Orbifold(gyrations=[3, 1, 1, 2], kaleidoscopes=[], handles=0, crosscaps=0)
-        self.assertEqual(o1.gyrations, [2, 3])
+        self.assertEqual(o1.gyrations, (2, 3))
 
     def test_kaleidoscope_normalization(self):
         o1 = Orbifold(gyrations=[], kaleidoscopes=[[1, 1, 2, 3], [4, 1, 3]], handles=0, crosscaps=0)
-        self.assertEqual(o1.kaleidoscopes, [[2, 3], [4, 3]])
+        self.assertEqual(o1.kaleidoscopes, ((2, 3), (4, 3)))
 
     def test_odd_crosscaps_normalization(self):
         o1 = Orbifold(gyrations=[], kaleidoscopes=[], handles=3, crosscaps=5)
@@ -79,6 +116,43 @@ class TestOrbifoldNormalization(unittest.TestCase):
         self.assertEqual(o1.crosscaps, 0)
 
 
+class TestOrbifoldParsing(unittest.TestCase):
+    def test_round_trip(self):
+        for signature in ['o(2,[12],n)*([0],12)*()xx', '*(n)', '(2,2,10)x', 'oo*()*(3,[101])', '']:
+            self.assertEqual(repr(Orbifold.from_string(signature)), signature)
+        for symbol_string in enumerate_symbols(4):
+            orbifold = PermutationSymbol(symbol_string).orbifold
+            self.assertEqual(Orbifold.from_string(repr(orbifold)), orbifold)
+            self.assertEqual(repr(Orbifold.from_string(repr(orbifold))), repr(orbifold))
+
+    def test_values(self):
+        orbifold = Orbifold.from_string('o(2,[12],n)*([0],12)*()xx')
+        self.assertEqual(orbifold.gyrations, (2, '[12]', 'n'))
+        self.assertEqual(orbifold.kaleidoscopes, (('[0]', 12), ()))
+        self.assertEqual((orbifold.handles, orbifold.crosscaps), (1, 2))
+
+    def test_invalid(self):
+        for signature in ['(2', 'o(x)*', '*(2,)', 'xo', '(2)(3)', '*[0]']:
+            self.assertRaises(ValueError, Orbifold.from_string, signature)
+
+    def test_canonical(self):
+        self.assertEqual(repr(Orbifold.from_string('(n)*([0],[1])*([2])').canonical()), '(n)*([0],[1])*([2])')
+        self.assertEqual(Orbifold.from_string('(n)*(a,a)*(a)').type_string(), '(n)*(a)*(a,a)')
+        self.assertEqual(Orbifold.from_string('*(3,2,a)*(a,2,3)').type_string(), '*(2,3,a)*(2,a,3)')
+        self.assertEqual(Orbifold.from_string('*(3,2,a)*(a,2,3)x').type_string(), '*(2,3,a)*(2,3,a)x')
+        for symbol_string in enumerate_symbols(4):
+            orbifold = PermutationSymbol(symbol_string).orbifold
+            self.assertEqual(orbifold.canonical(), orbifold)
+            self.assertEqual(Orbifold.from_string(orbifold.type_string()).canonical(),
+                             Orbifold.from_string(orbifold.type_string()))
+
+    def test_many(self):
+        signatures = ['([1],n)*([0])x\n', '*(n)\n', '([1],n)*([0])x\n']
+        orbifolds = Orbifold.parse_many(signatures)
+        self.assertIs(orbifolds[0], orbifolds[2])
+        self.assertEqual(Orbifold.format_many(orbifolds), [s.strip() for s in signatures])
+
+
 class TestOrbifoldsEqual(unittest.TestCase):
     def test_different_handles(self):
         o1 = Orbifold(gyrations=[], kaleidoscopes=[], handles=1, crosscaps=1)
@@ -277,6 +351,589 @@ class TestFaceCodes(unittest.TestCase):
         return Orbifold(gyrations, kaleidoscopes, handles, crosscaps)
 
 
+class TestFaceQueries(unittest.TestCase):
+    def test_faces_agree_with_set_face_info(self):
+        for symbol_string in ['[0](1,2)[3,4].', '<0,8>(1)[2,6](3,4)(5,7)*', '<0>[1](2,3)*', '<0>[1]<2>*', '(0)[1]*']:
+            ps = PermutationSymbol(symbol_string)
+            lazy = PermutationSymbol(symbol_string, face_info=False)
+            for face in [f for bc in ps.boundary_components for f in bc.faces] + list(ps.interior_faces):
+                for el in face.edgelines:
+                    found = lazy.face_of(None if el.edge is None else el.edge.index, el.side)
+                    self.assertEqual(set(map(repr, found.edgelines)), set(map(repr, face.edgelines)))
+                    self.assertEqual(found.location, face.location)
+                    self.assertEqual(found.number_of_sides(), face.number_of_sides())
+                    self.assertIs(ps.face_of(None if el.edge is None else el.edge.index, el.side), face)
+
+    def test_interior_face_order(self):
+        lazy = PermutationSymbol('<0,8>(1)[2,6](3,4)(5,7)*', face_info=False)
+        self.assertEqual(repr(lazy.face_of(6, EdgeLineSide.LOWER)),
+                         'None: [0U, 8L, 7U, 5L, 4U, 3L, 2U, 6U, 7L, 5U, 6L, 2L, 1U, 1L]')
+
+    def test_face_is_remembered(self):
+        lazy = PermutationSymbol('[0](1,2)[3,4].', face_info=False)
+        face = lazy.face_of(2, EdgeLineSide.UPPER)
+        self.assertIs(lazy.face_of(3, EdgeLineSide.LOWER), face)
+
+    def test_boundary_component(self):
+        lazy = PermutationSymbol('[0][1]*', face_info=False)
+        component = lazy.boundary_component_of(1)
+        self.assertEqual(len(component.faces), 3)
+        self.assertEqual(set(component.faces[0].edgelines), {EdgeLine(1, EdgeLineSide.UPPER, lazy),
+                                                             EdgeLine(None, EdgeLineSide.UPPER, lazy)})
+        self.assertIs(lazy.boundary_component_of(0), component)
+        self.assertIsNone(PermutationSymbol('(0,1).', face_info=False).boundary_component_of(0))
+
+    def test_queries_after_set_face_info(self):
+        ps = PermutationSymbol('<0>[1](2,3)*', face_info=False)
+        ps.face_of(2, EdgeLineSide.UPPER)
+        ps.boundary_component_of(1)
+        ps.set_face_info()
+        faces = [f for bc in ps.boundary_components for f in bc.faces] + list(ps.interior_faces)
+        self.assertTrue(any(ps.face_of(2, EdgeLineSide.UPPER) is face for face in faces))
+        for face in ps.boundary_component_of(1).faces:
+            self.assertIsNotNone(face.index)
+            self.assertTrue(any(face is f for f in faces))
+
+    def test_missing_edgeline(self):
+        lazy = PermutationSymbol('<0>[1]*', face_info=False)
+        with self.assertRaises(ValueError):
+            lazy.face_of(0, EdgeLineSide.LOWER)
+        with self.assertRaises(ValueError):
+            lazy.face_of(2, EdgeLineSide.UPPER)
+
+
+class TestSymbolTable(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'symbol_table.txt')
+        build_symbol_table(self.filename, 3)
+        self.previous_table = archimedean_tilings._symbol_table
+        use_symbol_table(self.filename)
+
+    def tearDown(self):
+        archimedean_tilings._symbol_table = self.previous_table
+        shutil.rmtree(self.directory)
+
+    def assertSameFaceInfo(self, symbol_string, spelling=None):
+        computed = PermutationSymbol(symbol_string, face_info=False)
+        computed.set_face_info(use_table=False)
+        looked_up = PermutationSymbol(spelling or symbol_string)
+        self.assertEqual(looked_up.face_code, computed.face_code)
+        self.assertEqual(repr(looked_up.orbifold), repr(computed.orbifold))
+        self.assertEqual(looked_up.num_faces, computed.num_faces)
+        self.assertEqual(repr(looked_up.boundary_components), repr(computed.boundary_components))
+        self.assertEqual(repr(looked_up.interior_faces), repr(computed.interior_faces))
+
+    def test_table_agrees(self):
+        for m in range(1, 4):
+            for symbol_string in enumerate_symbols(m):
+                self.assertSameFaceInfo(symbol_string)
+
+    def test_lookup(self):
+        ps = PermutationSymbol('(0)[1]*')
+        self.assertNotIn('boundary_components', ps.__dict__)  # the faces are built when first used
+        self.assertEqual(len(ps.boundary_components), 1)
+        with self.assertRaises(AttributeError):
+            ps.interior_faces = ()
+        self.assertSameFaceInfo('(0,2)(1).', '(1)( 0,2 ).')
+        self.assertSameFaceInfo('[0](1,2)[3,4].')  # not in the table
+
+    def test_other_formats_are_ignored(self):
+        with open(self.filename) as f:
+            records = f.readlines()[1:]
+        wrong_orbifold = records[0].split('\t')
+        wrong_orbifold[-1] = '*(99)\n'
+        for header in ['# archimedean_tilings symbol table, max_edges=3\n',
+                       '# archimedean_tilings symbol table, format 0, max_edges=3\n', None]:
+            with open(self.filename, 'w') as f:
+                if header is not None:  # otherwise the file is empty
+                    f.write(header)
+                    f.write('\t'.join(wrong_orbifold))
+            use_symbol_table(self.filename)
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                ps = PermutationSymbol(wrong_orbifold[0])
+            self.assertEqual(len(caught), 1)
+            self.assertNotEqual(repr(ps.orbifold), '*(99)')
+            self.assertSameFaceInfo(wrong_orbifold[0])
+
+    def test_canonical_string(self):
+        self.assertEqual(PermutationSymbol('[3,4](1, 2)[0].').canonical_string(), '[0](1,2)[3,4].')
+        self.assertEqual(PermutationSymbol('[1]<0><2>*').canonical_string(), '<0>[1]<2>*')
+
+
+def _face_code(ps):
+    return ps.face_code
+
+
+class TestImmutableResults(unittest.TestCase):
+    def test_results_cannot_be_changed(self):
+        ps = PermutationSymbol('[0](1,2)[3,4].')
+        self.assertIsInstance(ps.edges, tuple)
+        self.assertIsInstance(ps.face_code, tuple)
+        self.assertIsInstance(ps.boundary_components, tuple)
+        self.assertIsInstance(ps.interior_faces, tuple)
+        face = ps.boundary_components[0].faces[0]
+        self.assertIsInstance(face.edgelines, tuple)
+        with self.assertRaises(AttributeError):
+            face.index = 3
+        with self.assertRaises(AttributeError):
+            ps.boundary_components[0].faces = ()
+        with self.assertRaises(AttributeError):
+            ps.orbifold.crosscaps = 2
+        with self.assertRaises(ValueError):
+            ps.boundary_components[0].add_face(face)
+        for name in ('boundary_components', 'interior_faces', 'num_faces', 'face_code', 'orbifold'):
+            with self.assertRaises(AttributeError):
+                setattr(ps, name, None)
+            with self.assertRaises(AttributeError):
+                delattr(ps, name)
+        with self.assertRaises(AttributeError):
+            ps.set_face_info(use_table=False)
+        self.assertIsInstance(PermutationSymbol('(0)(1).', face_info=False).face_of(0, 1).edgelines, tuple)
+
+    def test_orbifold_hash(self):
+        o1 = Orbifold(gyrations=[], kaleidoscopes=[[2, 3, 4], [5, 6, 7]], handles=0, crosscaps=1)
+        o2 = Orbifold(gyrations=[], kaleidoscopes=[[6, 5, 7], [3, 4, 2]], handles=0, crosscaps=1)
+        self.assertEqual(o1, o2)
+        self.assertEqual(len({o1, o2}), 1)
+
+    def test_shared_between_threads(self):
+        lazy = PermutationSymbol('<0>[1](2,5)[3,4]*', face_info=False)
+        found = []
+
+        def work():
+            found.append([lazy.face_of(e, EdgeLineSide.UPPER) for e in range(5)] +
+                         [lazy.boundary_component_of(1)])
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for result in found:
+            self.assertTrue(all(a is b for a, b in zip(result, found[0])))
+
+    def test_map_symbols(self):
+        symbols = list(enumerate_symbols(4))
+        expected = [PermutationSymbol(s).face_code for s in symbols]
+        self.assertEqual(map_symbols(_face_code, symbols, workers=1), expected)
+        self.assertEqual(map_symbols(_face_code, symbols, workers=3, mode='thread', chunk_size=7), expected)
+        self.assertEqual(map_symbols(_face_code, symbols[:40], workers=2, mode='process'), expected[:40])
+        self.assertRaises(ValueError, map_symbols, _face_code, symbols, mode='fiber')
+
+
+class TestOrbifoldOnly(unittest.TestCase):
+    def test_agrees_with_orbifold(self):
+        for m in range(1, 6):
+            for symbol_string in enumerate_symbols(m):
+                orbifold = PermutationSymbol(symbol_string).orbifold
+                lazy = PermutationSymbol(symbol_string, face_info=False)
+                self.assertEqual(repr(lazy.orbifold_only()), repr(orbifold))
+                self.assertNotIn('interior_faces', lazy.__dict__)
+
+    def test_batch(self):
+        symbols = list(enumerate_symbols(3))
+        expected = [repr(PermutationSymbol(s).orbifold) for s in symbols]
+        self.assertEqual(list(map(repr, orbifolds_only(symbols))), expected)
+        self.assertEqual(list(map(repr, orbifolds_only(symbols, workers=2, mode='process'))), expected)
+
+
+class TestFaceCodeSearch(unittest.TestCase):
+    def test_parse_face_code(self):
+        self.assertEqual(parse_face_code('8b,a,(8b)^2'), [(8, 'b'), (1, 'a'), (8, 'b'), (8, 'b')])
+
+    def test_parse_invalid_face_code(self):
+        with self.assertRaises(ValueError):
+            parse_face_code('8b,a,(8b)')
+
+    def test_normalize_face_code(self):
+        self.assertEqual(normalize_face_code([(8, 3), (1, 2), (8, 3)]), normalize_face_code('8b,a,8b'))
+
+    def test_finds_symbol_from_table(self):
+        symbols = [ps.symbol_string for ps in find_symbols_by_face_code('3a,b,3a,3a')]
+        self.assertEqual(sorted(symbols), sorted(['(0)(1,2)(3).', '[0,3](1,2).', '(0)[1]*']))
+
+    def test_finds_symbol_from_permutation_symbol_face_code(self):
+        ps = PermutationSymbol('<0,8>(1)[2,6](3,4)(5,7)*')
+        symbols = [found.symbol_string for found in find_symbols_by_face_code(ps.face_code)]
+        self.assertIn(ps.symbol_string, symbols)
+        for found in find_symbols_by_face_code(ps.face_code):
+            self.assertEqual(normalize_face_code(found.face_code), normalize_face_code(ps.face_code))
+
+    def test_no_symbols(self):
+        self.assertEqual(list(find_symbols_by_face_code('5a')), [])
+
+
+def _crosscap_engine(symbol_string):
+    # gets the orbifold wrong whenever there is a twisted band
+    info = differential_check.label_face_info(symbol_string)
+    if '[' in symbol_string and ',' in symbol_string:
+        o = info.orbifold
+        info.orbifold = Orbifold(o.gyrations, o.kaleidoscopes, o.handles, 3 - o.crosscaps)
+    return info
+
+
+class TestFaceCodeEnumeration(unittest.TestCase):
+    def test_agrees_with_permutation_symbol(self):
+        for m in range(1, 6):
+            expected = [(s, normalize_face_code(PermutationSymbol(s).face_code)) for s in enumerate_symbols(m)]
+            self.assertEqual(sorted(enumerate_face_codes(m)), sorted(expected))
+
+    def test_face_filter(self):
+        def small_faces(sides, location):
+            return sides <= 4
+        found = sorted(enumerate_face_codes(5, small_faces))
+        self.assertEqual(found, sorted((s, face_code) for s, face_code in enumerate_face_codes(5)
+                                       if all(sides <= 4 for sides, _ in face_code)))
+
+        no_interior_faces = set(s for s, _ in enumerate_face_codes(4, lambda sides, location:
+                                                                    location == Location.BOUNDARY))
+        self.assertEqual(no_interior_faces,
+                         set(s for s in enumerate_symbols(4) if not PermutationSymbol(s).interior_faces))
+
+    def test_face_filter_prunes(self):
+        # Every symbol has a face, so a search which did not cut the branch of a rejected face would call the
+        # filter at least once per symbol.
+        closed = []
+
+        def no_faces(sides, location):
+            closed.append((sides, location))
+            return False
+        self.assertEqual(list(enumerate_face_codes(7, no_faces)), [])
+        self.assertLess(len(closed), count_symbols(7))
+        for sides, location in closed:
+            self.assertTrue(sides >= 1 and location in (Location.BOUNDARY, Location.INTERIOR))
+
+
+class TestDifferentialCheck(unittest.TestCase):
+    def test_enumerate_symbols(self):
+        self.assertEqual([len(list(enumerate_symbols(m))) for m in range(1, 6)], [5, 16, 50, 184, 740])
+        self.assertEqual(sorted(enumerate_symbols(1)), ['(0)*', '(0).', '<0>*', '[0]*', '[0].'])
+
+    def test_label_engine_agrees(self):
+        report = differential_check.run(5, processes=1)
+        self.assertEqual(report.num_symbols, 995)
+        self.assertEqual(report.failures, [])
+
+    def test_face_renumbering(self):
+        info = differential_check.reference_face_info('(0,1)[2].')
+        self.assertEqual(info.face_code, ((1, 1), (4, 0), (4, 0)))
+        normalized = differential_check.normalize(info)
+        self.assertEqual(normalized['face_code'], [(1, 0), (4, 1), (4, 1)])
+        self.assertEqual(repr(normalized['orbifold']), '([0],n)*([1])')
+
+    def test_minimized_counterexample(self):
+        report = differential_check.run(4, alternate=_crosscap_engine, processes=1)
+        self.assertTrue(report.failures)
+        self.assertEqual(report.counterexamples[0], ('[0,1].', ['orbifold']))
+
+
+class TestSymbolSampling(unittest.TestCase):
+    def test_count_symbols(self):
+        self.assertEqual([count_symbols(m) for m in range(1, 10)],
+                         [5, 16, 50, 184, 740, 3232, 15032, 74080, 383408])
+
+    def test_unrank_symbol(self):
+        for m in range(1, 6):
+            self.assertEqual([unrank_symbol(m, rank) for rank in range(count_symbols(m))], list(enumerate_symbols(m)))
+        self.assertRaises(ValueError, unrank_symbol, 2, 16)
+        self.assertRaises(ValueError, unrank_symbol, 2, -1)
+
+    def test_random_symbol(self):
+        rng = random.Random(7)
+        for m in (1, 2, 25):
+            ps = PermutationSymbol(random_symbol(m, rng))
+            self.assertEqual(ps.num_edges, m)
+        self.assertEqual(random_symbol(25, random.Random(7)), random_symbol(25, random.Random(7)))
+
+    def test_monte_carlo(self):
+        report = monte_carlo.run(5, 2000, seed=3, batch_size=300, processes=1)
+        self.assertEqual(report.num_samples, 2000)
+        self.assertEqual(repr(report.means), repr(monte_carlo.run(5, 2000, seed=3, batch_size=300, processes=1).means))
+        symbols = [PermutationSymbol(s) for s in enumerate_symbols(5)]
+        mean_faces = sum(ps.num_faces for ps in symbols) / len(symbols)
+        self.assertIn(mean_faces, report.means['num_faces'])
+        fraction_orientable = sum(ps.is_orientable for ps in symbols) / len(symbols)
+        self.assertIn(fraction_orientable, report.means['is_orientable'])
+        self.assertAlmostEqual(sum(e.value for e in report.orbifold_types.values()), 1.0)
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestEuclideanPatch(unittest.TestCase):
+    def check_patch(self, patch, radius):
+        vertices = patch.vertices
+        differences = vertices[:, None, :] - vertices[None, :, :]
+        distances = numpy.hypot(differences[..., 0], differences[..., 1])
+        numpy.fill_diagonal(distances, numpy.inf)
+        self.assertGreater(distances.min(), 1 - 1e-6)  # no duplicated or misplaced vertices
+
+        degrees = numpy.bincount(patch.edges.reshape(-1), minlength=len(vertices))
+        inner = numpy.hypot(vertices[:, 0], vertices[:, 1]) < radius - 2
+        self.assertTrue((degrees[inner] == len(patch.star)).all())
+
+    def test_square_tiling(self):
+        patch = EuclideanPatch(PermutationSymbol('[0].'), {0: 2, 'n': 4}, radius=6)
+        self.check_patch(patch, 6)
+        self.assertEqual(set(patch.face_sizes), {4})
+
+    def test_truncated_square_tiling(self):
+        patch = EuclideanPatch(PermutationSymbol('<0>[1]*'), {0: 4, 1: 4, 'n': 1}, radius=6)
+        self.check_patch(patch, 6)
+        self.assertEqual(set(patch.face_sizes), {4, 8})
+
+    def test_twisted_bands(self):
+        patch = EuclideanPatch(PermutationSymbol('[0,1][2,3].'), {0: 1, 'n': 1}, radius=6)
+        self.check_patch(patch, 6)
+
+    def test_max_vertices(self):
+        patch = EuclideanPatch(PermutationSymbol('(0).'), {0: 3, 'n': 6}, max_vertices=100)
+        self.assertEqual(len(patch.vertices), 100)
+        for face in patch.faces():
+            self.assertEqual(len(face), 3)
+
+    def test_not_euclidean(self):
+        with self.assertRaises(ValueError):
+            EuclideanPatch(PermutationSymbol('(0).'), {0: 3, 'n': 7}, radius=6)
+
+    def test_write_large_faces(self):
+        f = io.BytesIO()
+        write_arrays(f, numpy.zeros((300, 2)), numpy.array([300]), numpy.arange(300))
+        f.seek(0)
+        self.assertEqual(read_arrays(f)['face_sizes'].tolist(), [300])
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestHyperbolicPatch(unittest.TestCase):
+    def test_order_7_triangular_tiling(self):
+        patch = HyperbolicPatch(PermutationSymbol('(0).'), {0: 3, 'n': 7}, radius=4)
+        arrays = patch.arrays()
+        z = arrays['vertices'][:, 0] + 1j * arrays['vertices'][:, 1]
+        cross_ratios = 2 * abs(z[:, None] - z[None, :]) ** 2 / ((1 - abs(z[:, None]) ** 2) * (1 - abs(z[None, :]) ** 2))
+        numpy.fill_diagonal(cross_ratios, numpy.inf)
+        distances = numpy.arccosh(1 + cross_ratios)
+        self.assertGreater(distances.min(), patch.star.edge_length * (1 - 1e-6))
+
+        degrees = numpy.bincount(arrays['edges'].reshape(-1), minlength=len(z))
+        inner = 2 * numpy.arctanh(abs(z)) < 4 - patch.star.edge_length
+        self.assertTrue((degrees[inner] == 7).all())
+        self.assertEqual(set(arrays['face_sizes'].tolist()), {3})
+        self.assertEqual(len(arrays['face_vertices']), 3 * len(arrays['face_sizes']))
+
+    def test_not_hyperbolic(self):
+        with self.assertRaises(ValueError):
+            HyperbolicPatch(PermutationSymbol('(0).'), {0: 3, 'n': 6}, radius=4)
+
+    def test_write(self):
+        patch = HyperbolicPatch(PermutationSymbol('<0>[1]*'), {0: 4, 1: 5, 'n': 1}, radius=3)
+        arrays = patch.arrays()
+        directory = tempfile.mkdtemp()
+        try:
+            patch.write_arrays(directory)
+            for name in ('vertices', 'edges', 'face_sizes', 'face_vertices'):
+                written = numpy.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+                self.assertTrue((written == arrays[name]).all())
+        finally:
+            shutil.rmtree(directory)
+        f = io.StringIO()
+        patch.write_svg(f)
+        self.assertEqual(f.getvalue().count('<path'), len(arrays['face_sizes']))
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestCensus(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.census = Census.build(4)
+        cls.symbols = [PermutationSymbol(s) for m in range(1, 5) for s in enumerate_symbols(m)]
+
+    def test_count(self):
+        self.assertEqual(self.census.count(), 255)
+        self.assertEqual(self.census.filter(num_edges=4).count(), 184)
+        self.assertEqual(self.census.filter(num_edges=(1, 2), is_orientable=False).count(),
+                         sum(1 for ps in self.symbols if ps.num_edges <= 2 and not ps.is_orientable))
+
+    def test_group_by(self):
+        counts = self.census.group_by('num_edges', 'is_orientable').count()
+        self.assertEqual(counts[(3, False)],
+                         sum(1 for ps in self.symbols if ps.num_edges == 3 and not ps.is_orientable))
+        fractions = self.census.group_by('local_symmetry').mean(~self.census['is_orientable'])
+        star = [ps for ps in self.symbols if ps.local_symmetry == Location.BOUNDARY]
+        self.assertAlmostEqual(fractions[Location.BOUNDARY],
+                               sum(1 for ps in star if not ps.is_orientable) / float(len(star)))
+
+    def test_histogram(self):
+        histogram = self.census.group_by('num_edges').histogram('num_faces')
+        self.assertEqual(histogram[4],
+                         dict(collections.Counter(ps.num_faces for ps in self.symbols if ps.num_edges == 4)))
+
+    def test_orbifold_type(self):
+        types = self.census.histogram('orbifold_type')
+        self.assertEqual(types['(2,a,n)'], 1)
+        symbols = self.census.filter(orbifold_type='(2,a,n)')['symbol']
+        self.assertEqual(self.census.decode('symbol', symbols), ['(0).'])
+        orbifolds = [Orbifold.from_string(t) for t in self.census.categories['orbifold_type']]
+        for i in range(len(orbifolds)):  # equal orbifolds are one type
+            for j in range(i):
+                self.assertNotEqual(orbifolds[i], orbifolds[j])
+
+    def test_large_counts(self):
+        symbol_string = ''.join('(%d)' % i for i in range(300)) + '.'
+        census = Census.from_symbols([PermutationSymbol(symbol_string)])
+        self.assertEqual((census['num_edges'][0], census['num_rotary_arms'][0]), (300, 300))
+        self.assertEqual(census['num_faces'][0], PermutationSymbol(symbol_string).num_faces)
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            self.census.save(directory)
+            loaded = Census.load(directory)
+            self.assertEqual(loaded.group_by('orbifold_type').count(), self.census.group_by('orbifold_type').count())
+        finally:
+            shutil.rmtree(directory)
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestSymmetryGroup(unittest.TestCase):
+    def test_square_tiling_orbit(self):
+        ps = PermutationSymbol('[0].')
+        group = SymmetryGroup(ps, {0: 2, 'n': 4})
+        elements, lengths = group.elements(radius=6)
+        patch = EuclideanPatch(ps, {0: 2, 'n': 4}, radius=6)
+        self.assertEqual(len(elements), 4 * len(patch.vertices))  # the stabilizer of a vertex has order n
+
+    def test_cube_rotations(self):
+        group = SymmetryGroup(PermutationSymbol('(0).'), {0: 4, 'n': 3})
+        self.assertEqual(group.geometry, Geometry.SPHERICAL)
+        elements, lengths = group.elements(max_length=20)
+        self.assertEqual(len(elements), 24)
+
+    def test_generator_kinds(self):
+        group = SymmetryGroup(PermutationSymbol('<0,8>(1)[2,6](3,4)(5,7)*'), {0: 1, 1: 3, 'n': 3})
+        self.assertEqual(group.geometry, Geometry.HYPERBOLIC)
+        kinds = dict((g.name, g.kind) for g in group.generators)
+        self.assertEqual(kinds['*n'], IsometryKind.REFLECTION)
+        self.assertEqual(kinds['(1)'], IsometryKind.ROTATION)
+        self.assertEqual(kinds['[2,6]'], IsometryKind.GLIDE_REFLECTION)
+
+    def test_hyperbolic_elements_are_isometries(self):
+        group = SymmetryGroup(PermutationSymbol('(0).'), {0: 3, 'n': 7})
+        elements, lengths = group.elements(max_elements=1000)
+        self.assertEqual(len(elements), 1000)
+        form = numpy.diag([1.0, 1.0, -1.0])
+        for g in elements:
+            self.assertTrue(numpy.allclose(g.T.dot(form).dot(g), form, rtol=1e-6, atol=1e-6))
+        orbits = list(group.orbit(elements, numpy.array([[0.0, 0.0, 1.0]]), batch_size=300))
+        self.assertEqual([len(o) for o in orbits], [300, 300, 300, 100])
+
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestCellStructure(unittest.TestCase):
+    def test_face_labels(self):
+        for m in range(1, 6):
+            for s in enumerate_symbols(m):
+                ps = PermutationSymbol(s)
+                labels, boundary_components, num_faces = PermutationSymbol(s, face_info=False).face_labels()
+                self.assertEqual(num_faces, ps.num_faces)
+                self.assertEqual(boundary_components, [[f.index for f in bc.faces] for bc in ps.boundary_components])
+                for f in [f for bc in ps.boundary_components for f in bc.faces] + list(ps.interior_faces):
+                    for el in f.edgelines:
+                        code = 2 * (m if el.edge is None else el.edge.index) + el.side
+                        self.assertEqual(labels[code], f.index, s)
+
+    def test_single_symbol(self):
+        # edge 0 is a rotary arm, with both edgelines in face 0; edges 1 and 2 are a band between faces 0 and 1
+        cells = CellStructure.from_symbol(PermutationSymbol('(0)(1,2).', face_info=False))
+        self.assertEqual((cells.num_faces, cells.num_edges, cells.num_boundary_components), (2, 3, 0))
+        self.assertEqual(cells.face_edge.toarray().tolist(), [[2, 1, 1], [0, 1, 1]])
+        self.assertEqual(cells.face_face.toarray().tolist(), [[2, 2], [2, 0]])
+        self.assertEqual(cells.face_location.tolist(), [Location.INTERIOR] * 2)
+
+    def test_boundary(self):
+        ps = PermutationSymbol('[0,4](1)[2](3)*')
+        cells = CellStructure.from_symbol(ps)
+        self.assertEqual(cells.boundary_face.shape, (len(ps.boundary_components), ps.num_faces))
+        for c, bc in enumerate(ps.boundary_components):
+            self.assertEqual(cells.boundary_face.row(c)[0].tolist(), [f.index for f in bc.faces])
+        self.assertEqual(cells.face_location.tolist(), [f.location for f in
+                                                        [f for bc in ps.boundary_components for f in bc.faces] +
+                                                        list(ps.interior_faces)])
+
+    def test_block_diagonal(self):
+        symbols = list(enumerate_symbols(4))
+        cells = CellStructure.from_symbols(symbols)
+        self.assertEqual(len(cells), len(symbols))
+        face_face = cells.face_face.toarray()
+        face_edge = cells.face_edge.toarray()
+        self.assertTrue((face_face == face_face.T).all())
+        for k in (0, 17, len(symbols) - 1):
+            single = CellStructure.from_symbol(PermutationSymbol(symbols[k], face_info=False))
+            faces = slice(cells.face_offsets[k], cells.face_offsets[k + 1])
+            edges = slice(cells.edge_offsets[k], cells.edge_offsets[k + 1])
+            self.assertEqual(face_face[faces, faces].tolist(), single.face_face.toarray().tolist())
+            self.assertEqual(face_edge[faces, edges].tolist(), single.face_edge.toarray().tolist())
+            self.assertEqual(face_face[faces].sum(), face_face[faces, faces].sum())  # nothing outside the block
+            self.assertEqual(cells.symbol_of_faces(numpy.arange(faces.start, faces.stop)).tolist(),
+                             [k] * single.num_faces)
+        self.assertEqual(set(face_edge.sum(axis=0).tolist()), {1, 2})  # every edge has one or two edgelines
+
+    def test_workers(self):
+        symbols = list(enumerate_symbols(3))
+        serial = CellStructure.from_symbols(symbols)
+        threaded = CellStructure.from_symbols(symbols, workers=2, mode='thread')
+        for name in ('face_edge', 'face_face', 'boundary_face'):
+            a, b = getattr(serial, name), getattr(threaded, name)
+            for attribute in ('indptr', 'indices', 'data'):
+                self.assertEqual(getattr(a, attribute).tolist(), getattr(b, attribute).tolist())
+
+    def test_empty(self):
+        cells = CellStructure.from_symbols([])
+        self.assertEqual((cells.num_faces, cells.face_face.nnz, len(cells)), (0, 0, 0))
+
+
+class TestMemoryBudgets(unittest.TestCase):
+    def test_measure(self):
+        small = memory_benchmarks.measure('(0)(1)(2)(3).')
+        large = memory_benchmarks.measure('(0)(1)(2)(3)(4)(5)(6)(7).')
+        self.assertTrue(0 < small.retained <= small.peak)
+        self.assertLess(small.retained, large.retained)
+        self.assertLess(small.blocks, large.blocks)
+        self.assertEqual(memory_benchmarks.measure('(0)(1)(2)(3).'), small)
+
+    def test_measure_is_isolated(self):
+        before = memory_benchmarks.measure('<0,3>(1)(2)*')
+        symbols = [PermutationSymbol(s, face_info=False) for s in enumerate_symbols(4)]
+        self.assertEqual(memory_benchmarks.measure('<0,3>(1)(2)*'), before)
+
+    def test_measure_ignores_symbol_table(self):
+        before = memory_benchmarks.measure('(0)(1,2).')
+        directory = tempfile.mkdtemp()
+        previous = os.environ.get(archimedean_tilings.SYMBOL_TABLE_ENVIRONMENT_VARIABLE)
+        try:
+            filename = os.path.join(directory, 'symbol_table.txt')
+            build_symbol_table(filename, 3)
+            os.environ[archimedean_tilings.SYMBOL_TABLE_ENVIRONMENT_VARIABLE] = filename
+            self.assertEqual(memory_benchmarks.measure('(0)(1,2).'), before)
+        finally:
+            if previous is None:
+                del os.environ[archimedean_tilings.SYMBOL_TABLE_ENVIRONMENT_VARIABLE]
+            else:
+                os.environ[archimedean_tilings.SYMBOL_TABLE_ENVIRONMENT_VARIABLE] = previous
+            shutil.rmtree(directory)
+
+    def test_check(self):
+        usages = {('rotary_arms', 4): memory_benchmarks.MemoryUsage(1000, 500, 10),
+                  ('rotary_arms', 16): memory_benchmarks.MemoryUsage(1000, 500, 10)}
+        budgets = {('rotary_arms', 4): memory_benchmarks.MemoryUsage(1000, 400, 10)}
+        self.assertEqual(memory_benchmarks.check(usages, budgets),
+                         [('rotary_arms', 4, ['retained']), ('rotary_arms', 16, ['no budget'])])
+
+    @unittest.skipUnless(memory_benchmarks.budgets_python_version() == '.'.join(platform.python_version_tuple()[:2]),
+                         'The memory budgets were recorded with another version of Python')
+    def test_budgets(self):
+        usages = memory_benchmarks.measure_all()
+        self.assertEqual(memory_benchmarks.check(usages, memory_benchmarks.read_budgets()), [])
+
+
 def generate_permutation_symbol_test(symbol_string, correct_facecode_string, correct_orbifold_string=None):
     def test(self):  # self is of type TestFaceCode
         ps = PermutationSymbol(symbol_string)
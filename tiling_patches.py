@@ -0,0 +1,846 @@
+"""
+Geometric realizations of the Archimedean tilings described by permutation symbols.
+
+Given a PermutationSymbol and values for its parameters, the tiling is built outward from a single vertex.  Every
+vertex of an Archimedean tiling looks the same, so each vertex carries a frame (position, rotation and reflection)
+which places a copy of the vertex star there, and the permutation symbol tells us the frame of each neighbor.
+
+This module requires NumPy.
+"""
+
+import math
+import os
+
+import numpy as np
+
+from archimedean_tilings import DoilyFeature, Location
+
+
+class Geometry(object):
+    # the curvature of the plane
+    SPHERICAL = 1
+    EUCLIDEAN = 0
+    HYPERBOLIC = -1
+
+
+def _interior_angle(sides, edge_length, geometry):
+    # A regular polygon with the given number of sides and edge length L has interior angle t with
+    # cos(pi / sides) = sin(t / 2) cosh(L / 2) in the hyperbolic plane, and cos(L / 2) instead of cosh(L / 2) on the
+    # sphere.
+    if geometry == Geometry.EUCLIDEAN:
+        return math.pi - 2 * math.pi / sides
+    half_edge = np.cosh(edge_length / 2) if geometry == Geometry.HYPERBOLIC else np.cos(edge_length / 2)
+    return 2 * np.arcsin(np.minimum(np.cos(math.pi / sides) / half_edge, 1.0))
+
+
+class VertexStar:
+    """
+        The edges and faces around a vertex of the tiling, for a permutation symbol and concrete parameters.
+
+        The star is a list of slots, one for each edge at the vertex, in counterclockwise order.  Each slot has
+            angle: the direction of the edge, with slot 0 at angle 0
+            label: the index of the edge in the permutation symbol
+            chirality: +1, or -1 if the slot is a mirror image of the edge in the permutation symbol
+        and sides[k] is the number of sides of the face between slot k and slot k+1.
+
+        The slots for one copy of the permutation symbol are the edges 0, 1, ..., m-1, followed (if the local
+        symmetry is *) by their mirror images in reverse order, leaving out edges which lie on a mirror (half arms
+        and half bands).  With this order, entry k of the face code is exactly the face between slot k and slot k+1.
+        The whole star is n copies of these slots, where n is the vertex parameter.
+
+        If the Euclidean interior angles of the faces add up to 2 pi, the geometry is Euclidean and the edges have
+        length 1.  Otherwise the geometry is hyperbolic (angles too large) or spherical (angles too small), and the
+        edge length is chosen so that the interior angles in that geometry add up to 2 pi.
+    """
+    def __init__(self, permutation_symbol, parameters):
+        ps = permutation_symbol
+        self.permutation_symbol = ps
+        if 'n' not in parameters:
+            raise ValueError('The vertex parameter n must be given')
+        n = parameters['n']
+
+        labels = list(range(ps.num_edges))
+        chiralities = [1] * ps.num_edges
+        if ps.local_symmetry == Location.BOUNDARY:
+            on_mirror = (DoilyFeature.HALF_ARM, DoilyFeature.HALF_BAND)
+            for i in reversed(range(ps.num_edges)):
+                if (i == 0 or i == ps.num_edges - 1) and ps.edges[i].feature in on_mirror:
+                    continue
+                labels.append(i)
+                chiralities.append(-1)
+        assert len(labels) == len(ps.face_code)
+
+        sides = []
+        for number_of_sides, face_index in ps.face_code:
+            if face_index not in parameters:
+                raise ValueError('No value given for the parameter of face %d' % face_index)
+            sides.append(number_of_sides * parameters[face_index])
+        if min(sides) < 3:
+            raise ValueError('Faces with fewer than 3 sides cannot be realized')
+
+        self.slots_per_copy = len(labels)
+        self.labels = np.array(labels * n, dtype=np.int64)
+        self.chiralities = np.array(chiralities * n, dtype=np.int64)
+        self.sides = np.array(sides * n, dtype=np.int64)
+        self.angle_sum = float(_interior_angle(self.sides, 1.0, Geometry.EUCLIDEAN).sum())
+        self.set_geometry()
+        self.interior_angles = _interior_angle(self.sides, self.edge_length, self.geometry)
+        self.angles = np.concatenate(([0.0], np.cumsum(self.interior_angles)[:-1]))
+
+        # For each slot, the slot of the neighbor which points back along the same edge, and whether the symmetry
+        # taking the vertex to the neighbor reverses orientation.  Edges on a mirror may use either orientation.
+        partners = []
+        flips = []
+        for edge in ps.edges:
+            if edge.feature in (DoilyFeature.UNTWISTED_BAND, DoilyFeature.TWISTED_BAND, DoilyFeature.HALF_BAND):
+                partners.append(labels.index(edge.endpoint))
+            else:
+                partners.append(labels.index(edge.index))
+            flips.append(-1 if edge.feature in (DoilyFeature.FOLDED_BAND, DoilyFeature.TWISTED_BAND) else 1)
+        self.partner_slots = np.array(partners, dtype=np.int64)[self.labels]
+        self.flips = np.array(flips, dtype=np.int64)[self.labels]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def set_geometry(self):
+        if abs(self.angle_sum - 2 * math.pi) <= 1e-9:
+            self.geometry = Geometry.EUCLIDEAN
+            self.edge_length = 1.0
+            return
+
+        # The angle sum decreases with the edge length in the hyperbolic plane, and increases on the sphere, where
+        # the edges of the largest face can be at most 2 pi / sides long.  Solve for the edge length by bisection.
+        if self.angle_sum > 2 * math.pi:
+            self.geometry = Geometry.HYPERBOLIC
+            low, high = 0.0, 1.0
+            while _interior_angle(self.sides, high, self.geometry).sum() > 2 * math.pi:
+                high *= 2
+        else:
+            self.geometry = Geometry.SPHERICAL
+            low, high = 0.0, 2 * math.pi / self.sides.max()
+            if _interior_angle(self.sides, high, self.geometry).sum() < 2 * math.pi:
+                raise ValueError('The faces cannot meet at a vertex of a spherical tiling')
+        for _ in range(100):
+            middle = (low + high) / 2
+            angle_sum = _interior_angle(self.sides, middle, self.geometry).sum()
+            if (angle_sum > 2 * math.pi) == (self.geometry == Geometry.HYPERBOLIC):
+                low = middle
+            else:
+                high = middle
+        self.edge_length = (low + high) / 2
+
+
+class _SpatialHashGrid:
+    """
+        A spatial hash of points in the plane, with square cells of the given size.  The cells must be small enough
+        that no cell ever holds two distinct points, so each cell maps to at most one point index.  Copies of the
+        same point that differ by rounding error may still land in adjacent cells, so lookups check all 9 cells
+        around a query point.
+    """
+    def __init__(self, points, cell_size, tolerance):
+        self.cell_size = cell_size
+        self.tolerance = tolerance
+        self.points = points
+        keys = self.cell_keys(points, cell_size)
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    @staticmethod
+    def cell_keys(points, cell_size):
+        # pack the two cell coordinates into one int64, so cells can be sorted and searched as plain integers
+        cells = np.floor(points / cell_size).astype(np.int64) + (1 << 31)
+        return (cells[:, 0] << 32) | cells[:, 1]
+
+    def neighbor_keys(self, points):
+        """
+            Generate the keys of the cells to search for each point, starting with its own cell.
+        """
+        keys = self.cell_keys(points, self.cell_size)
+        for dx, dy in ((0, 0), (-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)):
+            yield keys + ((dx << 32) + dy)
+
+    def close(self, stored, points):
+        return np.hypot(*(self.points[stored] - points).T) <= self.tolerance
+
+    def lookup(self, points, smallest=False):
+        """
+            Return, for each query point, the index of a stored point within the tolerance, or -1.  If the grid
+            holds several copies of the same point, smallest=True asks for the smallest index among them;
+            otherwise the search stops at the first match, which is usually in the query point's own cell.
+        """
+        found = np.full(len(points), -1, dtype=np.int64)
+        if len(self.sorted_keys) == 0 or len(points) == 0:
+            return found
+        pending = np.arange(len(points))
+        for keys in self.neighbor_keys(points):
+            if not smallest:
+                pending = pending[found[pending] < 0]
+                if len(pending) == 0:
+                    break
+            keys = keys[pending]
+            position = np.searchsorted(self.sorted_keys, keys)
+            position = np.minimum(position, len(self.sorted_keys) - 1)
+            index = self.order[position]
+            hit = (self.sorted_keys[position] == keys) & self.close(index, points[pending])
+            current = found[pending]
+            better = hit & ((current < 0) | (index < current))
+            found[pending[better]] = index[better]
+        return found
+
+
+class _DiskHashGrid(_SpatialHashGrid):
+    """
+        A spatial hash of points in the Poincare disk whose cells have (roughly) the same hyperbolic size everywhere,
+        so the cells shrink towards the boundary of the disk along with the tiles.  The disk is cut into rings of
+        hyperbolic width cell_size around the center, and ring k is cut into sectors of hyperbolic width at most
+        cell_size.  The innermost ring is a single cell.  The tolerance is a hyperbolic distance.
+    """
+    @staticmethod
+    def ring_sizes(rings, cell_size):
+        sizes = np.ceil(2 * math.pi * np.sinh((rings + 1) * cell_size) / cell_size).astype(np.int64)
+        return np.where(rings == 0, 1, sizes)
+
+    @staticmethod
+    def polar(points, cell_size):
+        distance = 2 * np.arctanh(np.minimum(np.hypot(points[:, 0], points[:, 1]), 1 - 1e-16))
+        fraction = np.mod(np.arctan2(points[:, 1], points[:, 0]) / (2 * math.pi), 1.0)
+        return np.floor(distance / cell_size).astype(np.int64), fraction
+
+    @staticmethod
+    def cell_keys(points, cell_size):
+        rings, fraction = _DiskHashGrid.polar(points, cell_size)
+        sizes = _DiskHashGrid.ring_sizes(rings, cell_size)
+        return (rings << 32) | np.minimum(np.floor(fraction * sizes).astype(np.int64), sizes - 1)
+
+    def neighbor_keys(self, points):
+        yield self.cell_keys(points, self.cell_size)
+        rings, fraction = self.polar(points, self.cell_size)
+        for ring_offset in (-1, 0, 1):
+            neighbor_rings = np.maximum(rings + ring_offset, 0)
+            sizes = self.ring_sizes(neighbor_rings, self.cell_size)
+            sectors = np.floor(fraction * sizes).astype(np.int64)
+            for sector_offset in (-1, 0, 1):
+                yield (neighbor_rings << 32) | np.mod(sectors + sector_offset, sizes)
+
+    def close(self, stored, points):
+        # cosh(d) - 1 = 2 |z - w|^2 / ((1 - |z|^2) (1 - |w|^2))
+        x, y = self.points[stored].T
+        dx, dy = x - points[:, 0], y - points[:, 1]
+        denominator = (1 - x * x - y * y) * (1 - points[:, 0] ** 2 - points[:, 1] ** 2)
+        return 2 * (dx * dx + dy * dy) <= (math.cosh(self.tolerance) - 1) * denominator
+
+
+def _unique_points(points, cell_size, tolerance, grid_class=_SpatialHashGrid):
+    """
+        Merge points which agree up to the tolerance.  Return (representatives, inverse), where inverse maps each
+        point to the index of its representative, as in numpy.unique.
+    """
+    _, first, inverse = np.unique(grid_class.cell_keys(points, cell_size), return_index=True, return_inverse=True)
+    representatives = points[first]
+
+    # Copies of a point may straddle a cell boundary.  Each point can only spread over a 2 x 2 block of cells, so
+    # two rounds of pointer jumping reach the smallest representative.
+    grid = grid_class(representatives, cell_size, tolerance)
+    root = grid.lookup(representatives, smallest=True)
+    root = root[root]
+    root = root[root]
+    kept, root = np.unique(root, return_inverse=True)
+    return representatives[kept], root[inverse]
+
+
+class EuclideanPatch:
+    """
+        A finite patch of the Euclidean tiling with the given permutation symbol and parameters.
+
+        parameters maps each face index (as in PermutationSymbol.face_code) to its value, and 'n' to the vertex
+        parameter.  The interior angles around the vertex must add up to 2 pi.  All edges have length 1, and the
+        patch is grown breadth-first from a vertex at the origin until every vertex within the given radius has been
+        found, or until there are max_vertices vertices.
+
+        The patch is stored as arrays:
+            vertices: float array of shape (V, 2)
+            edges: int array of shape (E, 2)
+            face_sizes: int array with the number of sides of each face
+            face_vertices: int array with the vertices of all faces concatenated, each face counterclockwise
+        Only faces whose vertices all lie in the patch are included.
+    """
+    CELL_SIZE = 0.25  # distinct vertices (and distinct face centers) are always further apart than a cell diagonal
+    TOLERANCE = 1e-6
+
+    def __init__(self, permutation_symbol, parameters, radius=None, max_vertices=None):
+        if radius is None and max_vertices is None:
+            raise ValueError('Either radius or max_vertices must be given')
+        self.permutation_symbol = permutation_symbol
+        self.star = VertexStar(permutation_symbol, parameters)
+        if self.star.geometry != Geometry.EUCLIDEAN:
+            raise ValueError('The angles at the vertex add up to %f, not 2 pi, so the tiling is not Euclidean' %
+                             self.star.angle_sum)
+        self.radius = radius
+        self.max_vertices = max_vertices
+
+        self.set_vertices()
+        self.set_faces()
+
+    def neighbor_frames(self, positions, rotations, reflections):
+        """
+            Return the positions, rotations and reflections of the neighbors across every slot of every given vertex,
+            as arrays of shape (vertices, slots).
+        """
+        star = self.star
+        directions = rotations[:, None] + reflections[:, None] * star.angles[None, :]
+        neighbor_positions = positions[:, None, :] + np.stack((np.cos(directions), np.sin(directions)), axis=-1)
+
+        partner_chiralities = star.chiralities[star.partner_slots]
+        neighbor_reflections = reflections[:, None] * (star.chiralities * star.flips * partner_chiralities)[None, :]
+        neighbor_rotations = directions + math.pi - neighbor_reflections * star.angles[star.partner_slots][None, :]
+        neighbor_rotations = np.mod(neighbor_rotations, 2 * math.pi)
+        return neighbor_positions, neighbor_rotations, neighbor_reflections
+
+    def set_vertices(self):
+        cell_size = EuclideanPatch.CELL_SIZE
+        tolerance = EuclideanPatch.TOLERANCE
+        max_vertices = self.max_vertices if self.max_vertices is not None else np.inf
+
+        positions = [np.zeros((1, 2))]
+        rotations = [np.zeros(1)]
+        reflections = [np.ones(1, dtype=np.int64)]
+        edges = []
+        num_vertices = 1
+        previous_layer = np.zeros((0, 2))
+        previous_first = 0
+        layer_first = 0
+
+        # In a breadth-first search, the neighbors of layer k lie in layers k-1, k and k+1, so only the last two
+        # layers need to be in the spatial hash when we look for vertices we have already seen.
+        while len(positions[-1]) > 0 and num_vertices < max_vertices:
+            layer = positions[-1]
+            candidates, candidate_rotations, candidate_reflections = \
+                self.neighbor_frames(layer, rotations[-1], reflections[-1])
+            num_slots = candidates.shape[1]
+            candidates = candidates.reshape(-1, 2)
+            candidate_rotations = candidate_rotations.reshape(-1)
+            candidate_reflections = candidate_reflections.reshape(-1)
+            sources = np.repeat(np.arange(layer_first, layer_first + len(layer)), num_slots)
+            if self.radius is not None:
+                inside = np.hypot(candidates[:, 0], candidates[:, 1]) <= self.radius + tolerance
+                candidates = candidates[inside]
+                candidate_rotations = candidate_rotations[inside]
+                candidate_reflections = candidate_reflections[inside]
+                sources = sources[inside]
+
+            unique_candidates, inverse = _unique_points(candidates, cell_size, tolerance)
+            window = _SpatialHashGrid(np.concatenate((previous_layer, layer)), cell_size, tolerance)
+            seen = window.lookup(unique_candidates)
+            is_new = seen < 0
+            new_ids = np.cumsum(is_new) - 1
+            available = max(0, min(int(is_new.sum()), max_vertices - num_vertices))
+            if available < is_new.sum():
+                # keep only the new vertices closest to the origin
+                new_indices = np.flatnonzero(is_new)
+                distance = np.hypot(*unique_candidates[new_indices].T)
+                dropped = new_indices[np.argsort(distance, kind='stable')[available:]]
+                is_new[dropped] = False
+                seen[dropped] = -2
+                new_ids = np.cumsum(is_new) - 1
+            ids = np.where(is_new, num_vertices + new_ids, np.where(seen >= 0, previous_first + seen, -1))
+
+            candidate_ids = ids[inverse]
+            keep = candidate_ids >= 0
+            edges.append(np.stack((sources[keep], candidate_ids[keep]), axis=1))
+
+            # the frame of a new vertex is taken from the first candidate that reached it
+            first_candidate = np.full(len(unique_candidates), -1, dtype=np.int64)
+            first_candidate[inverse[::-1]] = np.arange(len(inverse))[::-1]
+            new_candidates = first_candidate[is_new]
+            previous_layer = layer
+            previous_first = layer_first
+            layer_first = num_vertices
+            positions.append(unique_candidates[is_new])
+            rotations.append(candidate_rotations[new_candidates])
+            reflections.append(candidate_reflections[new_candidates])
+            num_vertices += len(new_candidates)
+
+        self.vertices = np.concatenate(positions)
+        self.rotations = np.concatenate(rotations)
+        self.reflections = np.concatenate(reflections)
+        edges = np.concatenate(edges) if edges else np.zeros((0, 2), dtype=np.int64)
+        edges = np.sort(edges, axis=1)
+        edges = np.unique(edges[:, 0] * num_vertices + edges[:, 1])
+        self.edges = np.stack((edges // num_vertices, edges % num_vertices), axis=1)
+
+    def set_faces(self):
+        star = self.star
+        cell_size = EuclideanPatch.CELL_SIZE
+        tolerance = EuclideanPatch.TOLERANCE
+
+        # The face between slots k and k+1 starts along slot k when the frame preserves orientation, and along
+        # slot k+1 otherwise; in both cases we walk around it counterclockwise.
+        directions = self.rotations[:, None] + self.reflections[:, None] * star.angles[None, :]
+        next_directions = np.roll(directions, -1, axis=1)
+        first_directions = np.where(self.reflections[:, None] > 0, directions, next_directions).reshape(-1)
+        sides = np.broadcast_to(star.sides, directions.shape).reshape(-1)
+        corners = np.repeat(self.vertices, len(star), axis=0)
+
+        circumradius = 0.5 / np.sin(math.pi / sides)
+        bisector = first_directions + math.pi / 2 - math.pi / sides
+        centers = corners + circumradius[:, None] * np.stack((np.cos(bisector), np.sin(bisector)), axis=1)
+        centers, inverse = _unique_points(centers, cell_size, tolerance)
+        representative = np.full(len(centers), -1, dtype=np.int64)
+        representative[inverse[::-1]] = np.arange(len(inverse))[::-1]
+        start_angles = (bisector + math.pi)[representative]
+        sides = sides[representative]
+
+        grid = _SpatialHashGrid(self.vertices, cell_size, tolerance)
+        face_sizes = []
+        face_vertices = []
+        face_order = []
+        for p in np.unique(sides):
+            faces = np.flatnonzero(sides == p)
+            angles = start_angles[faces, None] + 2 * math.pi * np.arange(p)[None, :] / p
+            radius = 0.5 / math.sin(math.pi / p)
+            polygon = centers[faces, None, :] + radius * np.stack((np.cos(angles), np.sin(angles)), axis=-1)
+            ids = grid.lookup(polygon.reshape(-1, 2)).reshape(-1, p)
+            complete = (ids >= 0).all(axis=1)
+            face_order.append(representative[faces[complete]])
+            face_sizes.append(np.full(complete.sum(), p, dtype=np.int64))
+            face_vertices.append(ids[complete])
+
+        # list the faces in the order in which they were first reached
+        order = np.argsort(np.concatenate(face_order), kind='stable')
+        grouped_sizes = np.concatenate(face_sizes)
+        grouped_starts = np.concatenate(([0], np.cumsum(grouped_sizes)[:-1]))
+        grouped_vertices = np.concatenate([ids.reshape(-1) for ids in face_vertices])
+        self.face_sizes = grouped_sizes[order]
+        self.face_offsets = np.concatenate(([0], np.cumsum(self.face_sizes)))
+        gather = np.repeat(grouped_starts[order] - self.face_offsets[:-1], self.face_sizes) + \
+            np.arange(self.face_offsets[-1])
+        self.face_vertices = grouped_vertices[gather]
+
+    def faces(self):
+        """
+            Generate the faces as arrays of vertex indices.
+        """
+        for i in range(len(self.face_sizes)):
+            yield self.face_vertices[self.face_offsets[i]:self.face_offsets[i + 1]]
+
+    def write_svg(self, f, scale=20.0, chunk_size=10000):
+        write_svg(f, self.vertices, self.face_sizes, self.face_vertices, scale=scale, chunk_size=chunk_size)
+
+    def write_arrays(self, f):
+        write_arrays(f, self.vertices, self.face_sizes, self.face_vertices, edges=self.edges)
+
+
+def _disk_compose(a1, b1, e1, a2, b2, e2):
+    """
+        Compose isometries of the Poincare disk.  An isometry (a, b, e) is z -> (a w + b) / (conj(b) w + conj(a)),
+        where w = z if e = 1 and w = conj(z) if e = -1.  Return the isometry which applies the second one first.
+    """
+    a2 = np.where(e1 < 0, np.conj(a2), a2)
+    b2 = np.where(e1 < 0, np.conj(b2), b2)
+    return a1 * a2 + b1 * np.conj(b2), a1 * b2 + b1 * np.conj(a2), e1 * e2
+
+
+def _disk_apply(a, b, e, z):
+    w = np.where(e < 0, np.conj(z), z)
+    return (a * w + b) / (np.conj(b) * w + np.conj(a))
+
+
+def _disk_rotation(angle):
+    return np.exp(0.5j * angle), 0j, 1
+
+
+def _disk_translation(distance):
+    # translation along the real axis
+    return complex(math.cosh(distance / 2)), complex(math.sinh(distance / 2)), 1
+
+
+_DISK_CONJUGATION = (1 + 0j, 0j, -1)
+
+
+class PatchBatch:
+    """
+        Part of a patch, as generated by HyperbolicPatch.batches.
+            first_vertex: the index of the first of the new vertices
+            vertices: float array of shape (V, 2) with the new vertices
+            edges: int array of shape (E, 2) with the new edges
+            face_sizes, face_vertices: the new faces, as in EuclideanPatch
+            face_points: float array with the points of face_vertices, so faces can be drawn without the vertices
+    """
+    def __init__(self, first_vertex, vertices=None, edges=None, face_sizes=None, face_vertices=None,
+                 face_points=None):
+        self.first_vertex = first_vertex
+        self.vertices = vertices if vertices is not None else np.zeros((0, 2))
+        self.edges = edges if edges is not None else np.zeros((0, 2), dtype=np.int64)
+        self.face_sizes = face_sizes if face_sizes is not None else np.zeros(0, dtype=np.int64)
+        self.face_vertices = face_vertices if face_vertices is not None else np.zeros(0, dtype=np.int64)
+        self.face_points = face_points if face_points is not None else np.zeros((0, 2))
+
+
+class HyperbolicPatch:
+    """
+        A finite patch of the hyperbolic tiling with the given permutation symbol and parameters, in the Poincare
+        disk.  The parameters are given as for EuclideanPatch, and the interior angles of the Euclidean faces must add
+        up to more than 2 pi.  The edge length is then fixed by the angles (see VertexStar).
+
+        The patch contains every vertex within the given hyperbolic radius of the vertex at the center of the disk.
+        It is grown breadth-first as for EuclideanPatch, except that the frame of each vertex is an isometry of the
+        disk, and the frame of a neighbor is the frame of the vertex composed with one of the neighbor symmetries of
+        the star.  Rounding errors would slowly take the frames away from isometries, so they are renormalized every
+        RENORMALIZE_EVERY layers.
+
+        Nothing is kept for the whole patch: batches() generates the patch as PatchBatch objects, holding only the
+        last few layers of vertices, and write_svg and write_arrays write these batches as they come.  In double
+        precision, vertices can be told apart up to a radius of about 20.
+    """
+    CELL_FRACTION = 0.2  # cell size in the spatial hash, as a fraction of the edge length
+    TOLERANCE = 1e-6
+    RENORMALIZE_EVERY = 8
+    CHUNK_SIZE = 1 << 16  # vertices of a layer handled at once
+
+    def __init__(self, permutation_symbol, parameters, radius):
+        self.permutation_symbol = permutation_symbol
+        self.star = VertexStar(permutation_symbol, parameters)
+        if self.star.geometry != Geometry.HYPERBOLIC:
+            raise ValueError('The angles at the vertex add up to %f, not more than 2 pi, so the tiling is not '
+                             'hyperbolic' % self.star.angle_sum)
+        self.radius = radius
+        self.set_neighbor_symmetries()
+        self.set_face_templates()
+
+    def set_neighbor_symmetries(self):
+        # as in SymmetryGroup.neighbor_symmetry, for every slot of the star
+        star = self.star
+        a, b, e = [], [], []
+        for slot in range(len(star)):
+            partner = star.partner_slots[slot]
+            g = _disk_compose(*(_disk_rotation(star.angles[slot]) + _disk_translation(star.edge_length)))
+            g = _disk_compose(*(g + _disk_rotation(math.pi)))
+            if star.chiralities[slot] * star.flips[slot] * star.chiralities[partner] < 0:
+                g = _disk_compose(*(g + _DISK_CONJUGATION))
+            g = _disk_compose(*(g + _disk_rotation(-star.angles[partner])))
+            a.append(g[0])
+            b.append(g[1])
+            e.append(g[2])
+        self.neighbor_a = np.array(a, dtype=complex)
+        self.neighbor_b = np.array(b, dtype=complex)
+        self.neighbor_e = np.array(e, dtype=np.int64)
+
+    def set_face_templates(self):
+        """
+            For the vertex at the center, the corners of the face between slots k and k+1, counterclockwise starting
+            with the center.  The corners are found by rotating the center about the center of the face.
+        """
+        star = self.star
+        self.face_templates = []
+        for k in range(len(star)):
+            p = int(star.sides[k])
+            circumradius = math.asinh(math.sinh(star.edge_length / 2) / math.sin(math.pi / p))
+            bisector = star.angles[k] + star.interior_angles[k] / 2
+            to_center = _disk_compose(*(_disk_rotation(bisector) + _disk_translation(circumradius)))
+            from_center = _disk_compose(*(_disk_translation(-circumradius) + _disk_rotation(-bisector)))
+            corners = []
+            for j in range(p):
+                g = _disk_compose(*(to_center + _disk_rotation(2 * math.pi * j / p)))
+                g = _disk_compose(*(g + from_center))
+                corners.append(_disk_apply(g[0], g[1], g[2], 0j))
+            self.face_templates.append(np.array(corners))
+
+    @staticmethod
+    def renormalize(a, b):
+        # |a|^2 - |b|^2 = 1 for an isometry
+        scale = np.sqrt(np.abs(a) ** 2 - np.abs(b) ** 2)
+        return a / scale, b / scale
+
+    def batches(self):
+        """
+            Generate the patch as PatchBatch objects: each new layer of vertices with the edges back to the previous
+            layers, then the faces as soon as all their corners have been found.
+        """
+        star = self.star
+        cell_size = HyperbolicPatch.CELL_FRACTION * star.edge_length
+        tolerance = HyperbolicPatch.TOLERANCE
+        # the corners of a face are at most this many layers from each other
+        face_span = int(star.sides.max()) // 2 + 1
+
+        window = [_Layer(0, 0, np.zeros((1, 2)), np.ones(1, dtype=complex), np.zeros(1, dtype=complex),
+                         np.ones(1, dtype=np.int64))]
+        num_vertices = 1
+        yield PatchBatch(0, vertices=window[0].points)
+        while True:
+            layer = window[-1]
+            points, a, b, e, new_batches = self.expand_layer(layer, window[-2:], cell_size, tolerance)
+            for batch in new_batches:
+                yield batch
+            new_layer = _Layer(layer.index + 1, num_vertices, points, a, b, e)
+            num_vertices += len(new_layer.points)
+            window.append(new_layer)
+
+            finished = len(new_layer.points) == 0
+            for w in window:
+                if not w.faces_done and (finished or w.index <= new_layer.index - face_span):
+                    for batch in self.layer_faces(w, window, cell_size, tolerance):
+                        yield batch
+                    w.faces_done = True
+            if finished:
+                break
+            oldest_needed = min(w.index for w in window if not w.faces_done) - face_span
+            window = [w for w in window if w.index >= oldest_needed or w is window[-2]]
+
+    def expand_layer(self, layer, previous, cell_size, tolerance):
+        """
+            Find the neighbors of the given layer which are not in it or in the previous layers, CHUNK_SIZE vertices
+            of the layer at a time.  Return the points and frames of the new layer, and the PatchBatch objects for it.
+        """
+        star = self.star
+        # Neighbors of this layer lie in the previous layer, this one, or the next one.
+        grid = _DiskHashGrid(np.concatenate([w.points for w in previous]), cell_size, tolerance)
+        first_new = previous[-1].first_vertex + len(previous[-1].points)
+        points, a_parts, b_parts, e_parts, batches = [], [], [], [], []
+        num_new = 0
+        for first in range(0, len(layer.points), HyperbolicPatch.CHUNK_SIZE):
+            chunk = slice(first, first + HyperbolicPatch.CHUNK_SIZE)
+            a, b, e = _disk_compose(layer.a[chunk, None], layer.b[chunk, None], layer.e[chunk, None],
+                                    self.neighbor_a[None, :], self.neighbor_b[None, :], self.neighbor_e[None, :])
+            sources = np.repeat(layer.first_vertex + first + np.arange(len(a)), len(star))
+            a, b, e = a.reshape(-1), b.reshape(-1), e.reshape(-1)
+            if (layer.index + 1) % HyperbolicPatch.RENORMALIZE_EVERY == 0:
+                a, b = self.renormalize(a, b)
+            z = b / np.conj(a)
+            inside = 2 * np.arctanh(np.minimum(np.abs(z), 1 - 1e-16)) <= self.radius + 1e-9
+            a, b, e, z, sources = a[inside], b[inside], e[inside], z[inside], sources[inside]
+            candidates = np.stack((z.real, z.imag), axis=1)
+
+            unique_candidates, inverse = _unique_points(candidates, cell_size, tolerance, _DiskHashGrid)
+            seen = grid.lookup(unique_candidates)
+            ids = np.where(seen >= 0, previous[0].first_vertex + seen, -1)
+            if num_new:
+                # the new vertices found from earlier chunks
+                unknown = np.flatnonzero(ids < 0)
+                seen = _DiskHashGrid(np.concatenate(points), cell_size, tolerance).lookup(unique_candidates[unknown])
+                ids[unknown[seen >= 0]] = first_new + seen[seen >= 0]
+            is_new = ids < 0
+            ids[is_new] = first_new + num_new + np.arange(is_new.sum())
+            candidate_ids = ids[inverse]
+            forward = sources < candidate_ids  # each edge is reached from both ends
+            first_candidate = np.full(len(unique_candidates), -1, dtype=np.int64)
+            first_candidate[inverse[::-1]] = np.arange(len(inverse))[::-1]
+            new_candidates = first_candidate[is_new]
+
+            points.append(unique_candidates[is_new])
+            a_parts.append(a[new_candidates])
+            b_parts.append(b[new_candidates])
+            e_parts.append(e[new_candidates])
+            batches.append(PatchBatch(first_new + num_new, vertices=points[-1],
+                                      edges=np.stack((sources[forward], candidate_ids[forward]), axis=1)))
+            num_new += len(points[-1])
+        if not points:
+            return np.zeros((0, 2)), np.zeros(0, dtype=complex), np.zeros(0, dtype=complex), \
+                np.zeros(0, dtype=np.int64), batches
+        return np.concatenate(points), np.concatenate(a_parts), np.concatenate(b_parts), np.concatenate(e_parts), \
+            batches
+
+    def layer_faces(self, layer, window, cell_size, tolerance):
+        """
+            Generate the faces whose corner with the smallest index is in the given layer, as PatchBatch objects for
+            CHUNK_SIZE vertices of the layer at a time.
+        """
+        points = np.concatenate([w.points for w in window])
+        offsets = np.cumsum([0] + [len(w.points) for w in window])[:-1]
+        first_ids = np.concatenate([np.full(len(w.points), w.first_vertex - offset, dtype=np.int64)
+                                    for w, offset in zip(window, offsets)])
+        grid = _DiskHashGrid(points, cell_size, tolerance)
+
+        for first in range(0, len(layer.points), HyperbolicPatch.CHUNK_SIZE):
+            chunk = slice(first, first + HyperbolicPatch.CHUNK_SIZE)
+            a, b, e = layer.a[chunk, None], layer.b[chunk, None], layer.e[chunk, None]
+            vertex_ids = layer.first_vertex + first + np.arange(len(a))
+            face_sizes, face_vertices, face_points = [], [], []
+            for template in self.face_templates:
+                p = len(template)
+                z = _disk_apply(a, b, e, template[None, :])
+                # reflected frames list the corners clockwise
+                order = np.concatenate(([0], np.arange(p - 1, 0, -1)))
+                z = np.where(e < 0, z[:, order], z)
+                corners = np.stack((z.real, z.imag), axis=-1).reshape(-1, 2)
+                found = grid.lookup(corners)
+                ids = np.where(found >= 0, found + first_ids[found], -1).reshape(-1, p)
+                keep = (ids >= 0).all(axis=1) & (ids.min(axis=1) == vertex_ids)
+                face_sizes.append(np.full(keep.sum(), p, dtype=np.int64))
+                face_vertices.append(ids[keep].reshape(-1))
+                face_points.append(corners.reshape(-1, p, 2)[keep].reshape(-1, 2))
+            yield PatchBatch(layer.first_vertex + first, face_sizes=np.concatenate(face_sizes),
+                             face_vertices=np.concatenate(face_vertices), face_points=np.concatenate(face_points))
+
+    def arrays(self):
+        """
+            Build the whole patch in memory.  Return a dict with the arrays vertices, edges, face_sizes and
+            face_vertices, as in EuclideanPatch.
+        """
+        parts = dict((name, []) for name in ('vertices', 'edges', 'face_sizes', 'face_vertices'))
+        for batch in self.batches():
+            for name in parts:
+                parts[name].append(getattr(batch, name))
+        return dict((name, np.concatenate(arrays)) for name, arrays in parts.items())
+
+    def write_svg(self, f, scale=500.0):
+        """
+            Write the patch to the file object f as an SVG image of the Poincare disk with the given radius, drawing
+            each edge as an arc of a geodesic.
+        """
+        f.write('<svg xmlns="http://www.w3.org/2000/svg" viewBox="%.3f %.3f %.3f %.3f">\n' %
+                (-1.01 * scale, -1.01 * scale, 2.02 * scale, 2.02 * scale))
+        f.write('<circle cx="0" cy="0" r="%.3f" fill="none" stroke="black"/>\n' % scale)
+        f.write('<g stroke="black" stroke-width="%.3f">\n' % (scale / 1000))
+        for batch in self.batches():
+            if len(batch.face_sizes):
+                f.write(''.join(_disk_svg_paths(batch.face_sizes, batch.face_points, scale)))
+        f.write('</g>\n</svg>\n')
+
+    def write_arrays(self, directory):
+        """
+            Write the patch to the given directory as the NumPy files vertices.npy (float64, since vertices crowd
+            together near the boundary of the disk), edges.npy, face_sizes.npy and face_vertices.npy, creating the
+            directory if needed.  The files are appended to batch by batch, and can be read back with
+            numpy.load(..., mmap_mode='r').
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        writers = {'vertices': _NpyAppender(os.path.join(directory, 'vertices.npy'), np.float64, (2,)),
+                   'edges': _NpyAppender(os.path.join(directory, 'edges.npy'), np.uint32, (2,)),
+                   'face_sizes': _NpyAppender(os.path.join(directory, 'face_sizes.npy'), np.uint32),
+                   'face_vertices': _NpyAppender(os.path.join(directory, 'face_vertices.npy'), np.uint32)}
+        try:
+            for batch in self.batches():
+                for name, writer in writers.items():
+                    writer.append(getattr(batch, name))
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+
+class _Layer:
+    # one breadth-first layer of a HyperbolicPatch, with the frames of its vertices
+    def __init__(self, index, first_vertex, points, a, b, e):
+        self.index = index
+        self.first_vertex = first_vertex
+        self.points = points
+        self.a = a
+        self.b = b
+        self.e = e
+        self.faces_done = False
+
+
+_SVG_COLORS = ['#e6194b', '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4', '#46f0f0', '#f032e6', '#bcf60c',
+               '#fabebe', '#008080', '#e6beff']
+
+
+def write_svg(f, vertices, face_sizes, face_vertices, scale=20.0, chunk_size=10000):
+    """
+        Write faces to the file object f as an SVG image, one polygon per face, colored by number of sides.
+        The faces are formatted chunk_size at a time, so the whole document is never held in memory.
+    """
+    if len(vertices):
+        low = vertices.min(axis=0) * scale
+        high = vertices.max(axis=0) * scale
+    else:
+        low = high = np.zeros(2)
+    f.write('<svg xmlns="http://www.w3.org/2000/svg" viewBox="%.3f %.3f %.3f %.3f">\n' %
+            (low[0] - scale, -high[1] - scale, high[0] - low[0] + 2 * scale, high[1] - low[1] + 2 * scale))
+    f.write('<g stroke="black" stroke-width="%.3f">\n' % (scale / 20))
+    offsets = np.concatenate(([0], np.cumsum(face_sizes)))
+    points = vertices * np.array([scale, -scale])  # SVG has y pointing down
+    for first in range(0, len(face_sizes), chunk_size):
+        last = min(first + chunk_size, len(face_sizes))
+        coordinates = points[face_vertices[offsets[first]:offsets[last]]]
+        lines = []
+        for i in range(first, last):
+            polygon = coordinates[offsets[i] - offsets[first]:offsets[i + 1] - offsets[first]]
+            lines.append('<polygon fill="%s" points="%s"/>\n' %
+                         (_SVG_COLORS[face_sizes[i] % len(_SVG_COLORS)],
+                          ' '.join('%.3f,%.3f' % (x, y) for x, y in polygon)))
+        f.write(''.join(lines))
+    f.write('</g>\n</svg>\n')
+
+
+def write_arrays(f, vertices, face_sizes, face_vertices, **arrays):
+    """
+        Write a patch to f (a file name or file object) in NumPy .npz format, with the arrays vertices (float32),
+        face_sizes (uint32) and face_vertices (uint32), along with any other arrays given as keyword arguments.
+    """
+    np.savez(f, vertices=vertices.astype(np.float32), face_sizes=face_sizes.astype(np.uint32),
+             face_vertices=face_vertices.astype(np.uint32), **arrays)
+
+
+def read_arrays(f):
+    """
+        Read a patch written by write_arrays.  Return a dict of arrays.
+    """
+    with np.load(f) as data:
+        return dict((name, data[name]) for name in data.files)
+
+
+def _disk_svg_paths(face_sizes, face_points, scale):
+    """
+        SVG paths for faces in the Poincare disk.  The geodesic from z1 to z2 is an arc of the circle through z1 and
+        z2 which meets the unit circle at right angles, or a straight line if z1 and z2 are in line with the center.
+    """
+    start = face_points
+    end = np.empty_like(face_points)
+    offsets = np.concatenate(([0], np.cumsum(face_sizes)))
+    end[:-1] = face_points[1:]
+    end[offsets[1:] - 1] = face_points[offsets[:-1]]  # close each face
+    cross = start[:, 0] * end[:, 1] - start[:, 1] * end[:, 0]
+    straight = np.abs(cross) < 1e-12
+    safe_cross = np.where(straight, 1.0, cross)
+    rhs_start = ((start ** 2).sum(axis=1) + 1) / 2
+    rhs_end = ((end ** 2).sum(axis=1) + 1) / 2
+    center = np.stack((rhs_start * end[:, 1] - rhs_end * start[:, 1],
+                       start[:, 0] * rhs_end - end[:, 0] * rhs_start), axis=1) / safe_cross[:, None]
+    radius = np.sqrt(np.maximum((center ** 2).sum(axis=1) - 1, 0)) * scale
+    sweep = ((start - center)[:, 0] * (end - center)[:, 1] - (start - center)[:, 1] * (end - center)[:, 0]) > 0
+
+    paths = []
+    for i in range(len(face_sizes)):
+        first, last = offsets[i], offsets[i + 1]
+        commands = ['M%.4f %.4f' % (start[first, 0] * scale, -start[first, 1] * scale)]
+        for k in range(first, last):
+            x, y = end[k, 0] * scale, -end[k, 1] * scale  # SVG has y pointing down
+            if straight[k]:
+                commands.append('L%.4f %.4f' % (x, y))
+            else:
+                commands.append('A%.4f %.4f 0 0 %d %.4f %.4f' % (radius[k], radius[k], sweep[k], x, y))
+        paths.append('<path fill="%s" d="%sZ"/>\n' % (_SVG_COLORS[face_sizes[i] % len(_SVG_COLORS)],
+                                                      ' '.join(commands)))
+    return paths
+
+
+class _NpyAppender:
+    """
+        Write a .npy file whose length is not known in advance.  The header is written with room to spare and
+        rewritten with the final shape on close().
+    """
+    HEADER_SIZE = 256
+
+    def __init__(self, path, dtype, row_shape=()):
+        self.f = open(path, 'wb')
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.rows = 0
+        self.write_header()
+
+    def write_header(self):
+        shape = (self.rows,) + tuple(self.row_shape)
+        header = "{'descr': '%s', 'fortran_order': False, 'shape': %r, }" % (self.dtype.str, shape)
+        header = header.ljust(_NpyAppender.HEADER_SIZE - 11) + '\n'
+        self.f.seek(0)
+        self.f.write(b'\x93NUMPY\x01\x00' + np.array(len(header), dtype='<u2').tobytes() + header.encode('latin1'))
+        self.f.seek(0, 2)
+
+    def append(self, array):
+        self.f.write(np.ascontiguousarray(array, dtype=self.dtype).tobytes())
+        self.rows += len(array)
+
+    def close(self):
+        self.write_header()
+        self.f.close()